@@ -0,0 +1,298 @@
+"""性能基准：用固定种子测量棋盘生成、提示搜索、存档读写和画面绘制的耗时，结果输出为 JSON
+
+给出 --baseline 时与之前保存的结果逐项比较，变慢超过阈值的项目记为退化并以非零状态退出。
+用法示例：python benchmark.py --output bench.json
+          python benchmark.py --baseline bench.json --threshold 0.15
+"""
+
+import argparse
+import atexit
+import contextlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+# 必须在导入 game 之前设置：使用无窗口的 SDL 驱动，存档写到临时目录，不影响玩家的存档
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+BENCH_DATA_DIR = tempfile.mkdtemp(prefix='game-bench-')
+os.environ['GAME_DATA_DIR'] = BENCH_DATA_DIR
+# 先注册的后执行，存档管理器退出时写盘之后再删除临时目录
+atexit.register(shutil.rmtree, BENCH_DATA_DIR, True)
+
+import pygame
+
+import difficulty
+import game
+import savestore
+
+BENCH_FORMAT_VERSION = 1
+DEFAULT_SEED = 20240601
+DEFAULT_THRESHOLD = 0.10  # 比基准慢 10% 以上记为退化
+# 旧格式（board_layers 嵌套列表）的存档，用于比较新旧存档格式
+LEGACY_SAVE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'savegame.json')
+
+
+# 汇总一组样本；better 为 'lower' 表示数值越小越好
+def summarize(samples, unit, better='lower'):
+    ordered = sorted(samples)
+    return {
+        'value': round(statistics.median(ordered), 4),
+        'min': round(ordered[0], 4),
+        'mean': round(statistics.fmean(ordered), 4),
+        'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4),
+        'samples': len(ordered),
+        'unit': unit,
+        'better': better,
+    }
+
+
+# 重复调用 func，每次调用前执行不计时的 setup，返回每次调用的耗时（毫秒）
+def time_calls(func, repeat, setup=None, inner=1):
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start_time = time.perf_counter()
+        for _ in range(inner):
+            func()
+        samples.append((time.perf_counter() - start_time) * 1000 / inner)
+    return samples
+
+
+# 等待后台预生成的下一关完成并丢弃它，避免与计时抢占 CPU，也让下一次 create_board 真正生成棋盘
+def settle_prefetch():
+    prefetch = game.level_prefetch
+    if prefetch:
+        prefetch['future'].result()
+    game.level_prefetch = None
+
+
+# 开始一局固定种子的游戏，停在指定关卡的初始棋盘上
+def start_seeded_game(seed, level_num):
+    game.selected_character = 0
+    game.start_new_game('bench', seed=seed)
+    if level_num != game.level:
+        settle_prefetch()
+        game.level = level_num
+        game.create_board()
+    settle_prefetch()
+
+
+def bench_create_board(results, args):
+    for level_num in args.levels:
+        start_seeded_game(args.seed, level_num)
+        results[f'create_board.level{level_num}'] = summarize(
+            time_calls(game.create_board, args.board_repeat, setup=settle_prefetch), 'ms')
+        settle_prefetch()
+
+
+def bench_uncovered_tiles(results, args):
+    for level_num in args.levels:
+        start_seeded_game(args.seed, level_num)
+        results[f'uncovered_tiles.live.level{level_num}'] = summarize(
+            [ms * 1000 for ms in time_calls(game.get_all_uncovered_tiles, args.repeat, inner=100)], 'us')
+
+
+def bench_hint_search(results, args):
+    for level_num in args.levels:
+        start_seeded_game(args.seed, level_num)
+        root_state = game.build_solver_state()
+        for name, full_solve, repeat in (('hint', False, args.repeat), ('full_solve', True, args.board_repeat)):
+            rates = []
+            latencies = []
+            for _ in range(repeat):
+                # 每次都从空的置换表开始，测的是搜索本身而不是查表
+                game.hint_table.clear()
+                result = game.find_hint_sequence(root_state, full_solve=full_solve)
+                rates.append(result['nodes'] / max(result['seconds'], 1e-9))
+                latencies.append(result['seconds'] * 1000)
+            results[f'{name}.nodes_per_second.level{level_num}'] = summarize(rates, 'nodes/s', 'higher')
+            results[f'{name}.latency.level{level_num}'] = summarize(latencies, 'ms')
+
+
+def bench_persistence(results, args):
+    start_seeded_game(args.seed, args.levels[-1])
+    store = game.save_store
+    # 不让后台线程抢先写盘，写盘耗时单独由 flush 测量
+    store.flush_delay = 3600
+    scores = iter(range(1, 10 ** 9))
+
+    # 分数递增，每次保存都会进入存档列表
+    def next_score():
+        game.score = next(scores)
+
+    results['save_game'] = summarize(time_calls(game.save_game, args.repeat, setup=next_score), 'ms')
+
+    def record_change():
+        next_score()
+        game.save_game()
+
+    results['save_flush'] = summarize(time_calls(store.flush, args.repeat, setup=record_change), 'ms')
+    store.flush()
+
+    def load_first():
+        if not game.load_specific_game(0):
+            raise RuntimeError("无法加载刚保存的存档")
+
+    results['load_specific_game'] = summarize(time_calls(load_first, args.repeat, setup=settle_prefetch), 'ms')
+    settle_prefetch()
+
+
+# 旧格式每格一个 JSON 数字，按层、行、列展开为每格一个字节
+def decode_legacy_board(game_data):
+    return bytes(number or 0 for layer in game_data['board_layers'] for row in layer for number in row)
+
+
+# 比较旧格式与打包格式的文件大小、序列化和解析耗时
+# 旧格式按旧版 save_game 的方式（indent=4）写出，新格式按 SaveStore.flush 的方式写出
+def bench_save_format(results, args):
+    with open(args.legacy_save, 'r', encoding='utf-8') as f:
+        legacy = json.load(f)
+    packed = dict(legacy)
+    packed['saved_games'] = [savestore.migrate_game(game_data) for game_data in legacy['saved_games']]
+    packed['format'] = savestore.SAVE_FORMAT_VERSION
+    formats = {
+        'legacy': (legacy, lambda data: json.dumps(data, ensure_ascii=False, indent=4), decode_legacy_board),
+        'packed': (packed, lambda data: json.dumps(data, ensure_ascii=False, separators=(',', ':')),
+                   lambda game_data: savestore.decode_board(game_data['board'])),
+    }
+    for name, (data, dump, decode) in formats.items():
+        text = dump(data)
+
+        def parse_and_decode():
+            for game_data in json.loads(text)['saved_games']:
+                decode(game_data)
+
+        results[f'save_format.{name}.bytes'] = summarize([len(text.encode('utf-8'))], 'bytes')
+        results[f'save_format.{name}.serialize'] = summarize(time_calls(lambda: dump(data), args.repeat), 'ms')
+        results[f'save_format.{name}.parse_decode'] = summarize(time_calls(parse_and_decode, args.repeat), 'ms')
+
+
+def bench_rendering(results, args):
+    for level_num in args.levels:
+        start_seeded_game(args.seed, level_num)
+        game.screen.set_clip(None)
+        results[f'draw_game_elements.level{level_num}'] = summarize(
+            time_calls(game.draw_game_elements, args.repeat * 5), 'ms')
+        # render_game 的整屏重绘（含 flip）和画面不变时的空帧
+        results[f'render_game.full.level{level_num}'] = summarize(
+            time_calls(game.render_game, args.repeat * 5, setup=game.invalidate_game_screen), 'ms')
+        game.render_game()
+        results[f'render_game.idle.level{level_num}'] = summarize(
+            [ms * 1000 for ms in time_calls(game.render_game, args.repeat, inner=100)], 'us')
+
+
+BENCHMARKS = {
+    'create_board': bench_create_board,
+    'uncovered_tiles': bench_uncovered_tiles,
+    'hint_search': bench_hint_search,
+    'persistence': bench_persistence,
+    'save_format': bench_save_format,
+    'rendering': bench_rendering,
+}
+
+
+# 与基准结果比较，返回 ({项目: 比较结果}, 退化的项目列表)
+# change 为相对基准变慢的比例，负数表示变快
+def compare(results, baseline, threshold):
+    comparison = {}
+    regressions = []
+    for name, metric in results.items():
+        base = baseline.get(name)
+        if not base or base.get('unit') != metric['unit'] or not base.get('value') or not metric['value']:
+            continue
+        if metric['better'] == 'higher':
+            change = base['value'] / metric['value'] - 1
+        else:
+            change = metric['value'] / base['value'] - 1
+        comparison[name] = {'baseline': base['value'], 'change': round(change, 4)}
+        if change > threshold:
+            regressions.append(name)
+    return comparison, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="测量游戏热点路径的耗时，输出 JSON 并与基准比较")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="本局种子，决定每关的棋盘")
+    parser.add_argument('--levels', default='1,3,5', help="关卡，如 1-5 或 1,3")
+    parser.add_argument('--repeat', type=int, default=20, help="每个项目的重复次数")
+    parser.add_argument('--board-repeat', type=int, default=5, help="生成棋盘和整关求解的重复次数")
+    parser.add_argument('--only', default=','.join(BENCHMARKS),
+                        help="逗号分隔的测试组：" + ','.join(BENCHMARKS))
+    parser.add_argument('--output', default='-', help="结果文件，- 为标准输出")
+    parser.add_argument('--legacy-save', default=LEGACY_SAVE_FILE, help="save_format 组使用的旧格式存档文件")
+    parser.add_argument('--baseline', help="之前保存的结果文件，用于比较")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help="判定为退化的变慢比例")
+    args = parser.parse_args(argv)
+
+    args.levels = difficulty.parse_levels(args.levels)
+    for level_num in args.levels:
+        if not 1 <= level_num <= game.MAX_LEVEL:
+            parser.error(f"关卡超出范围：{level_num}")
+    groups = args.only.split(',')
+    for group in groups:
+        if group not in BENCHMARKS:
+            parser.error(f"未知的测试组：{group}")
+    args.repeat = max(1, args.repeat)
+    args.board_repeat = max(1, args.board_repeat)
+    game.init_display()
+
+    results = {}
+    start_time = time.perf_counter()
+    # 游戏代码的提示信息不混入 JSON 输出
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for group in groups:
+            group_start = time.perf_counter()
+            BENCHMARKS[group](results, args)
+            print(f"{group}: {time.perf_counter() - group_start:.1f} 秒", file=sys.stderr)
+
+    report = {
+        'format': BENCH_FORMAT_VERSION,
+        'meta': {
+            'seed': args.seed,
+            'levels': args.levels,
+            'repeat': args.repeat,
+            'board_repeat': args.board_repeat,
+            'python': platform.python_version(),
+            'pygame': pygame.version.ver,
+            'platform': platform.platform(),
+            'video_driver': pygame.display.get_driver(),
+            'seconds': round(time.perf_counter() - start_time, 2),
+        },
+        'results': results,
+    }
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        report['comparison'], regressions = compare(results, baseline.get('results', {}), args.threshold)
+        report['regressions'] = regressions
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output == '-':
+        print(text)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+
+    print(f"{'项目':<40}  {'中位数':>12}{'单位':>10}{'变化':>10}", file=sys.stderr)
+    for name, metric in results.items():
+        change = report.get('comparison', {}).get(name)
+        change_text = f"{change['change']:+.1%}" if change else '-'
+        mark = ' !' if name in regressions else ''
+        print(f"{name:<42}{metric['value']:>12.3f}{metric['unit']:>10}{change_text:>10}{mark}", file=sys.stderr)
+    if regressions:
+        print(f"{len(regressions)} 个项目比基准慢 {args.threshold:.0%} 以上", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
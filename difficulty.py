@@ -0,0 +1,199 @@
+"""关卡难度估计：每关生成若干棋盘，用随机、贪心和求解器策略分别对局，统计胜率等指标
+
+每局的结果在完成后立即写入 CSV 或 JSONL 报告，结束时输出每关每种策略的汇总。
+用法示例：python difficulty.py --levels 1-5 --boards 200 --output report.jsonl
+"""
+
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+import engine
+import solver
+
+# 求解器策略每个棋盘的节点预算：结果只取决于棋盘，与机器负载和工作进程数无关
+# 1-5 关的棋盘通常在 5000 个节点内解出；时间上限只用于防止个别棋盘耗时过长
+SOLVER_NODE_BUDGET = 50000
+SOLVER_TIME_LIMIT = 60.0  # 秒
+
+# 报告中每局结果的字段
+RESULT_FIELDS = ['level', 'board', 'seed', 'attempts', 'policy', 'status', 'moves', 'score',
+                 'tiles_left', 'dead_end', 'seconds']
+
+
+# 求解器策略：先求出整关路线再照着走；证明无解时记为死局，预算或时间用完记为 unknown
+def play_solver(state, max_nodes, time_limit):
+    result = solver.solve_level(*state.solver_state(), time_limit=time_limit, max_nodes=max_nodes)
+    if result.status == solver.SOLVE_SOLVED:
+        for cell in result.moves:
+            state.pick(cell)
+        return state.status
+    return engine.LOST if result.status == solver.SOLVE_LOST else solver.SOLVE_UNKNOWN
+
+
+# 在工作进程中执行：生成一个棋盘并用每种策略各玩一局，返回结果列表
+def run_board(task):
+    level_num, board_index, game_seed, policies, solvable, solver_nodes, solver_time = task
+    seed = engine.level_seed(game_seed, level_num)
+    game_engine = engine.Engine(solvable=solvable)
+    kinds, jitter, stats = engine.generate_layout(level_num, seed, solvable, game_engine.time_budget)
+    rows = []
+    for policy_name in policies:
+        state = engine.GameState(level_num, kinds, jitter, game_engine.max_stack)
+        start_time = time.perf_counter()
+        if policy_name == 'solver':
+            status = play_solver(state, solver_nodes, solver_time)
+        else:
+            rng = random.Random(f"{seed}-{policy_name}")
+            status = game_engine.play(state, engine.POLICIES[policy_name](), rng)['status']
+        rows.append({
+            'level': level_num,
+            'board': board_index,
+            'seed': seed,
+            'attempts': stats['attempts'],
+            'policy': policy_name,
+            'status': status,
+            'moves': state.moves,
+            'score': state.score,
+            'tiles_left': state.board_count + len(state.stack),
+            # 死局：棋盘上还有图案时已经无法继续
+            'dead_end': status == engine.LOST and state.board_count > 0,
+            'seconds': round(time.perf_counter() - start_time, 4),
+        })
+    return rows
+
+
+class ReportWriter:
+    """按文件扩展名以 CSV 或 JSONL 格式逐行写出结果，每行写完立即刷新"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'w', encoding='utf-8', newline='') if path != '-' else sys.stdout
+        self.is_csv = path.endswith('.csv')
+        self.writer = None
+        if self.is_csv:
+            self.writer = csv.DictWriter(self.file, fieldnames=RESULT_FIELDS)
+            self.writer.writeheader()
+
+    def write(self, row):
+        if self.is_csv:
+            self.writer.writerow(row)
+        else:
+            self.file.write(json.dumps(row, ensure_ascii=False) + '\n')
+        self.file.flush()
+
+    def write_summary(self, summary):
+        # CSV 的列固定为每局结果，汇总只写入 JSONL
+        if not self.is_csv:
+            self.write(dict(summary, type='summary'))
+
+    def close(self):
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+class Summary:
+    """累计某一关某种策略的结果"""
+
+    def __init__(self, level_num, policy):
+        self.level = level_num
+        self.policy = policy
+        self.games = 0
+        self.wins = 0
+        self.dead_ends = 0
+        self.unknown = 0
+        self.win_moves = 0
+
+    def add(self, row):
+        self.games += 1
+        if row['status'] == engine.WON:
+            self.wins += 1
+            self.win_moves += row['moves']
+        elif row['status'] == solver.SOLVE_UNKNOWN:
+            self.unknown += 1
+        if row['dead_end']:
+            self.dead_ends += 1
+
+    def as_dict(self):
+        return {
+            'level': self.level,
+            'policy': self.policy,
+            'games': self.games,
+            'win_rate': round(self.wins / self.games, 4) if self.games else 0.0,
+            'average_solution_length': round(self.win_moves / self.wins, 2) if self.wins else None,
+            'dead_end_rate': round(self.dead_ends / self.games, 4) if self.games else 0.0,
+            'unknown_rate': round(self.unknown / self.games, 4) if self.games else 0.0,
+        }
+
+
+# 解析 "1-5" 或 "1,3,5" 形式的关卡列表
+def parse_levels(text):
+    levels = []
+    for part in text.split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            levels.extend(range(int(first), int(last) + 1))
+        else:
+            levels.append(int(part))
+    return levels
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="用多种策略批量对局，估计每关的难度")
+    parser.add_argument('--levels', default='1-5', help="关卡，如 1-5 或 1,3")
+    parser.add_argument('--boards', type=int, default=100, help="每关生成的棋盘数")
+    parser.add_argument('--policies', default='random,greedy,solver',
+                        help="逗号分隔的策略：" + ','.join(sorted(engine.POLICIES)) + ",solver")
+    parser.add_argument('--seed', type=int, default=0, help="起始种子，第 i 个棋盘使用 seed + i")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="工作进程数")
+    parser.add_argument('--solvable', action='store_true', help="与游戏相同，只使用求解器确认有解的棋盘")
+    parser.add_argument('--solver-nodes', type=int, default=SOLVER_NODE_BUDGET, help="求解器策略的节点预算")
+    parser.add_argument('--solver-time', type=float, default=SOLVER_TIME_LIMIT,
+                        help="求解器策略的时间上限（秒），只作为节点预算之外的保护")
+    parser.add_argument('--output', default='-', help="报告文件，扩展名为 .csv 时写 CSV，否则写 JSONL；- 为标准输出")
+    args = parser.parse_args(argv)
+
+    policies = args.policies.split(',')
+    for policy_name in policies:
+        if policy_name != 'solver' and policy_name not in engine.POLICIES:
+            parser.error(f"未知的策略：{policy_name}")
+    levels = parse_levels(args.levels)
+    tasks = [(level_num, i, args.seed + i, policies, args.solvable, args.solver_nodes, args.solver_time)
+             for level_num in levels for i in range(args.boards)]
+
+    summaries = {(level_num, policy_name): Summary(level_num, policy_name)
+                 for level_num in levels for policy_name in policies}
+    report = ReportWriter(args.output)
+    start_time = time.perf_counter()
+    try:
+        with multiprocessing.Pool(max(1, args.workers)) as pool:
+            for rows in pool.imap_unordered(run_board, tasks):
+                for row in rows:
+                    summaries[(row['level'], row['policy'])].add(row)
+                    report.write(row)
+        # 汇总中记录求解器的预算和工作进程数，超时造成的 unknown 与负载有关
+        settings = {'solver_nodes': args.solver_nodes, 'solver_time': args.solver_time, 'workers': args.workers}
+        for summary in summaries.values():
+            report.write_summary(dict(summary.as_dict(), **settings))
+    finally:
+        report.close()
+
+    seconds = time.perf_counter() - start_time
+    print(f"{len(tasks)} 个棋盘，用时 {seconds:.1f} 秒，{args.workers} 个工作进程，"
+          f"求解器预算 {args.solver_nodes} 个节点（时间上限 {args.solver_time} 秒）", file=sys.stderr)
+    print(f"{'关卡':<4}{'策略':<8}{'局数':>6}{'胜率':>8}{'平均步数':>10}{'死局率':>8}{'未知':>8}", file=sys.stderr)
+    for summary in summaries.values():
+        row = summary.as_dict()
+        length = row['average_solution_length']
+        print(f"{row['level']:<6}{row['policy']:<10}{row['games']:>6}{row['win_rate']:>10.1%}"
+              f"{length if length is not None else '-':>12}{row['dead_end_rate']:>10.1%}"
+              f"{row['unknown_rate']:>8.1%}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
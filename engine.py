@@ -0,0 +1,363 @@
+"""不依赖 pygame 的游戏规则：生成棋盘、拿取、撤销、消除和胜负判定，可用于批量模拟
+
+用法示例：python engine.py --level 3 --games 2000 --policy greedy
+"""
+
+import argparse
+import json
+import random
+import time
+
+import solver
+
+# 棋盘尺寸与 solver.py 一致
+ROWS, COLS = solver.ROWS, solver.COLS
+LAYER_COUNT = solver.LAYER_COUNT
+CELL_COUNT = solver.CELL_COUNT
+LAYER_CELLS = ROWS * COLS  # 每层的格子数
+
+TILE_SIZE = 60  # 图案大小（像素）
+BOARD_LEFT = 150  # 棋盘右移，避免遮挡角色
+# 每层的偏移量，使层与层之间错开
+LAYER_OFFSETS = [
+    (0, 0),  # 底层不偏移
+    (TILE_SIZE // 4, TILE_SIZE // 4),  # 第二层偏移
+    (TILE_SIZE // 2, TILE_SIZE // 2),  # 第三层偏移
+]
+JITTER_SPREAD = TILE_SIZE // 8  # 每个格子随机小偏移的最大值
+
+MAX_STACK_SIZE = 7  # 栈的最大容量
+MAX_LEVEL = 5  # 最大关卡数
+MAX_TILE_KINDS = 8  # 最大图案种类数
+BOARD_SOLVE_TIME_LIMIT = 1.0  # 生成棋盘时每次确认有解的时间上限（秒）
+
+# 对局状态
+PLAYING = 'playing'
+WON = 'won'
+LOST = 'lost'
+
+# 计算某一关的图案序列，返回 (图案种类数, 图案编号列表)
+def level_tiles(level_num):
+    # 随着关卡提升增加图案种类
+    tile_kinds = min(6 + level_num - 1, MAX_TILE_KINDS)
+
+    # 动态调整每种图案的数量，每关增加2个，且为3的倍数
+    tiles_per_kind = 6 + (level_num - 1) * 2
+    tiles_per_kind = max(3, tiles_per_kind)
+    tiles_per_kind = ((tiles_per_kind + 2) // 3) * 3
+
+    # 图案总数不能超过可用位置数量
+    if tile_kinds * tiles_per_kind > CELL_COUNT:
+        reduction_factor = CELL_COUNT / (tile_kinds * tiles_per_kind)
+        tiles_per_kind = int(tiles_per_kind * reduction_factor) // 3 * 3
+        tiles_per_kind = max(3, tiles_per_kind)
+
+    total_tiles = []
+    for i in range(1, tile_kinds + 1):
+        total_tiles.extend([i] * tiles_per_kind)
+    return tile_kinds, total_tiles
+
+# 每一关的随机种子由本局种子和关卡号决定，同一种子总是生成同一棋盘
+def level_seed(game_seed, level_num):
+    return game_seed * 1000003 + level_num
+
+# 每个格子的随机小偏移只由关卡种子决定，按格子编号排列
+def level_jitter(seed):
+    rng = random.Random(f"{seed}-jitter")
+    return [(rng.randint(-JITTER_SPREAD, JITTER_SPREAD), rng.randint(-JITTER_SPREAD, JITTER_SPREAD))
+            for _ in range(CELL_COUNT)]
+
+# 格子上图案左上角的像素坐标
+def cell_position(cell, jitter):
+    layer, row, col = solver.cell_coords(cell)
+    offset_x, offset_y = LAYER_OFFSETS[layer]
+    jitter_x, jitter_y = jitter[cell]
+    return (col * TILE_SIZE + offset_x + jitter_x + BOARD_LEFT,
+            row * TILE_SIZE + offset_y + jitter_y)
+
+# 判断上层图案是否压住下层图案：上层图案的任意一个角落在下层图案范围内
+# 与 pygame.Rect.collidepoint 相同，范围包含左、上边，不包含右、下边
+def covers(upper_pos, lower_pos):
+    upper_x, upper_y = upper_pos
+    lower_x, lower_y = lower_pos
+    hit_x = lower_x <= upper_x < lower_x + TILE_SIZE or lower_x <= upper_x + TILE_SIZE < lower_x + TILE_SIZE
+    hit_y = lower_y <= upper_y < lower_y + TILE_SIZE or lower_y <= upper_y + TILE_SIZE < lower_y + TILE_SIZE
+    return hit_x and hit_y
+
+# 可能存在遮挡的 (下层格子, 上层格子) 对：层偏移加随机偏移小于一个图案，只需检查相邻的行列
+COVER_REACH = 1 + (LAYER_OFFSETS[-1][0] + 2 * JITTER_SPREAD) // TILE_SIZE
+COVER_CANDIDATES = [
+    (solver.cell_id(lower_layer, row, col), solver.cell_id(upper_layer, upper_row, upper_col))
+    for lower_layer in range(LAYER_COUNT)
+    for row in range(ROWS)
+    for col in range(COLS)
+    for upper_layer in range(lower_layer + 1, LAYER_COUNT)
+    for upper_row in range(max(0, row - COVER_REACH), min(ROWS, row + COVER_REACH + 1))
+    for upper_col in range(max(0, col - COVER_REACH), min(COLS, col + COVER_REACH + 1))
+]
+
+# 计算给定格子之间的遮挡关系，返回 (covered_by, covering)，键为格子编号，按编号排列
+def compute_cover_graph(cells, jitter):
+    covered_by = {cell: [] for cell in sorted(cells)}
+    covering = {cell: [] for cell in covered_by}
+    positions = {cell: cell_position(cell, jitter) for cell in covered_by}
+    for lower_cell, upper_cell in COVER_CANDIDATES:
+        if lower_cell in positions and upper_cell in positions \
+                and covers(positions[upper_cell], positions[lower_cell]):
+            covered_by[lower_cell].append(upper_cell)
+            covering[upper_cell].append(lower_cell)
+    return covered_by, covering
+
+# 把图案序列随机放到棋盘上，返回按格子编号排列的图案编号（0 为空）
+def place_kinds(total_tiles, rng=random):
+    # 打乱图案序列
+    total_tiles = total_tiles.copy()
+    rng.shuffle(total_tiles)
+
+    # 所有可能的位置按格子编号排列，打乱后依次放置图案
+    positions = list(range(CELL_COUNT))
+    rng.shuffle(positions)
+
+    kinds = [0] * CELL_COUNT
+    for tile_number, cell in zip(total_tiles, positions):
+        kinds[cell] = tile_number
+    return kinds
+
+# 生成一关棋盘，返回 (图案编号, 像素偏移, 统计)，不修改任何全局状态，可以在后台线程中调用
+# solvable 为 True 时只接受求解器确认有解的棋盘，time_budget 为生成的总时间预算（秒）
+# 第 k 次尝试使用 (seed, k) 派生的随机数，因此结果只取决于种子和求解器能否在时限内确认有解
+def generate_layout(level_num, seed, solvable, time_budget, solve_time_limit=BOARD_SOLVE_TIME_LIMIT,
+                    max_stack=MAX_STACK_SIZE):
+    _, total_tiles = level_tiles(level_num)
+    jitter = level_jitter(seed)
+    start_time = time.perf_counter()
+    attempts = 0
+    status = None
+    while True:
+        attempts += 1
+        rng = random.Random(f"{seed}-{attempts}")
+        kinds = place_kinds(total_tiles, rng)
+        if not solvable:
+            break
+        board_cells = {cell: kind for cell, kind in enumerate(kinds) if kind}
+        cover_graph = compute_cover_graph(board_cells, jitter)[0]
+        remaining_time = time_budget - (time.perf_counter() - start_time)
+        result = solver.solve_level(*solver.build_state(board_cells, [], cover_graph, max_stack),
+                                    time_limit=max(0.0, min(solve_time_limit, remaining_time)))
+        status = result.status
+        if status == solver.SOLVE_SOLVED or time.perf_counter() - start_time >= time_budget:
+            break
+    stats = {
+        'level': level_num,
+        'seed': seed,
+        'attempts': attempts,
+        'seconds': time.perf_counter() - start_time,
+        'status': status,
+    }
+    return kinds, jitter, stats
+
+
+class GameState:
+    """一关的完整局面：棋盘、遮挡计数、栈、得分和胜负状态，不依赖显示"""
+
+    def __init__(self, level_num, kinds, jitter, max_stack=MAX_STACK_SIZE, stack=()):
+        self.level = level_num
+        self.kinds = list(kinds)  # 格子编号 -> 图案编号，0 为空
+        self.jitter = jitter
+        self.max_stack = max_stack
+        # stack 为加载存档时恢复的栈，格子编号为负表示原始位置未知，不能撤销
+        self.stack = list(stack)  # (原始格子编号, 图案编号)
+        # 栈中的图案可能被撤销放回，它们的格子也要参与建图
+        cells = {cell for cell, kind in enumerate(self.kinds) if kind}
+        cells.update(cell for cell, _ in self.stack if cell >= 0)
+        self.covered_by, self.covering = compute_cover_graph(sorted(cells), jitter)
+        self.blocked_count = {
+            cell: sum(1 for upper_cell in upper_cells if self.kinds[upper_cell])
+            for cell, upper_cells in self.covered_by.items()
+        }
+        self.free = {cell for cell, count in self.blocked_count.items() if count == 0 and self.kinds[cell]}
+        # 每种图案可以拿取的格子，供贪心策略直接查询
+        self.free_by_kind = [set() for _ in range(solver.MAX_KINDS)]
+        for cell in self.free:
+            self.free_by_kind[self.kinds[cell]].add(cell)
+        self.board_count = sum(1 for kind in self.kinds if kind)
+        self.stack_counts = [0] * solver.MAX_KINDS
+        for _, kind in self.stack:
+            self.stack_counts[kind] += 1
+        self.score = 0
+        self.moves = 0
+        self.status = PLAYING
+
+    def free_cells(self):
+        """当前可以拿取的格子，按编号排列"""
+        return sorted(self.free)
+
+    def pick(self, cell):
+        """拿取一个未被遮挡的图案放入栈中，返回本次消除的组数"""
+        if self.status != PLAYING or cell not in self.free:
+            raise ValueError(f"格子 {cell} 当前不能拿取")
+        kind = self.kinds[cell]
+        self.kinds[cell] = 0
+        self.board_count -= 1
+        self.free.discard(cell)
+        self.free_by_kind[kind].discard(cell)
+        for lower_cell in self.covering[cell]:
+            self.blocked_count[lower_cell] -= 1
+            if self.blocked_count[lower_cell] == 0 and self.kinds[lower_cell]:
+                self.free.add(lower_cell)
+                self.free_by_kind[self.kinds[lower_cell]].add(lower_cell)
+        self.stack.append((cell, kind))
+        self.stack_counts[kind] += 1
+        self.moves += 1
+
+        if len(self.stack) > self.max_stack:
+            self.status = LOST  # 栈已满
+            return 0
+        matched = 0
+        if self.stack_counts[kind] >= 3:
+            # 从栈尾开始移除三个相同的图案
+            remove_count = 0
+            i = len(self.stack) - 1
+            while remove_count < 3:
+                if self.stack[i][1] == kind:
+                    del self.stack[i]
+                    remove_count += 1
+                i -= 1
+            self.stack_counts[kind] -= 3
+            self.score += 100
+            matched = 1
+        if self.board_count == 0:
+            # 棋盘清空后，栈为空则胜利，否则栈中剩余的图案已无法消除
+            self.status = WON if not self.stack else LOST
+        return matched
+
+    def undo(self):
+        """把栈顶的图案放回原来的格子，返回是否成功；已消除和原始位置未知的图案不能撤销"""
+        if not self.stack or self.stack[-1][0] < 0:
+            return False
+        cell, kind = self.stack.pop()
+        self.stack_counts[kind] -= 1
+        self.kinds[cell] = kind
+        self.board_count += 1
+        if self.blocked_count[cell] == 0:
+            self.free.add(cell)
+            self.free_by_kind[kind].add(cell)
+        for lower_cell in self.covering[cell]:
+            self.blocked_count[lower_cell] += 1
+            self.free.discard(lower_cell)
+            self.free_by_kind[self.kinds[lower_cell]].discard(lower_cell)
+        self.moves += 1
+        self.status = PLAYING
+        return True
+
+    def greedy_cells(self):
+        """游戏中的贪心提示：用最少的拿取凑成一组且不使栈溢出，没有时返回空列表
+
+        拿取次数相同时选择最小可拿取格子编号更小的图案，返回该图案编号最小的几个格子。
+        """
+        best_cells = []
+        for kind in range(1, solver.MAX_KINDS):
+            needed = 3 - self.stack_counts[kind]
+            if not 0 < needed <= len(self.free_by_kind[kind]) or len(self.stack) + needed > self.max_stack:
+                continue
+            if best_cells and needed > len(best_cells):
+                continue
+            cells = sorted(self.free_by_kind[kind])[:needed]
+            if not best_cells or needed < len(best_cells) or cells[0] < best_cells[0]:
+                best_cells = cells
+        return best_cells
+
+    def solver_state(self):
+        """转换为求解器使用的 (SolverBoard, SolverState)"""
+        board_cells = {cell: kind for cell, kind in enumerate(self.kinds) if kind}
+        return solver.build_state(board_cells, [kind for _, kind in self.stack],
+                                  self.covered_by, self.max_stack)
+
+
+# 随机策略：在可拿取的图案中随机选择
+def random_policy(state, rng):
+    return rng.choice(state.free_cells())
+
+# 贪心策略：像游戏中的玩家一样跟随贪心提示（game.find_greedy_hint），提示的图案依次拿完后再求下一个提示
+# 没有提示时选择栈中已有的图案，再否则随机
+class GreedyPolicy:
+    def __init__(self):
+        self.hint = []  # 尚未拿取的提示格子，拿取其他格子不会遮住它们
+
+    def __call__(self, state, rng):
+        if not self.hint:
+            self.hint = state.greedy_cells()
+        if self.hint:
+            return self.hint.pop(0)
+        paired = sorted(cell for kind, count in enumerate(state.stack_counts) if count
+                        for cell in state.free_by_kind[kind])
+        return rng.choice(paired or state.free_cells())
+
+# 策略名 -> 创建策略的函数；每局创建一个新的策略 policy(state, rng) -> 格子
+POLICIES = {
+    'random': lambda: random_policy,
+    'greedy': GreedyPolicy,
+}
+
+
+class Engine:
+    """按种子生成关卡并用策略自动对局，供批量模拟使用"""
+
+    def __init__(self, solvable=False, time_budget=2.0, max_stack=MAX_STACK_SIZE):
+        self.solvable = solvable
+        self.time_budget = time_budget
+        self.max_stack = max_stack
+
+    def new_game(self, level_num, seed):
+        """生成第 level_num 关的棋盘，seed 为关卡种子"""
+        kinds, jitter, stats = generate_layout(level_num, seed, self.solvable, self.time_budget,
+                                               max_stack=self.max_stack)
+        state = GameState(level_num, kinds, jitter, self.max_stack)
+        return state, stats
+
+    def play(self, state, policy, rng, max_moves=10000):
+        """用 policy(state, rng) -> 格子 自动对局直到分出胜负，返回对局结果"""
+        while state.status == PLAYING and state.moves < max_moves:
+            state.pick(policy(state, rng))
+        return {
+            'level': state.level,
+            'status': state.status,
+            'moves': state.moves,
+            'score': state.score,
+            'tiles_left': state.board_count + len(state.stack),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="不打开窗口，批量模拟对局")
+    parser.add_argument('--level', type=int, default=1, help="关卡")
+    parser.add_argument('--games', type=int, default=1000, help="对局数")
+    parser.add_argument('--policy', choices=sorted(POLICIES), default='greedy', help="拿取策略")
+    parser.add_argument('--seed', type=int, default=0, help="起始种子，第 i 局使用 seed + i")
+    parser.add_argument('--solvable', action='store_true', help="只使用求解器确认有解的棋盘")
+    args = parser.parse_args(argv)
+
+    engine = Engine(solvable=args.solvable)
+    wins = 0
+    total_moves = 0
+    start_time = time.perf_counter()
+    for i in range(args.games):
+        game_seed = args.seed + i
+        state, _ = engine.new_game(args.level, level_seed(game_seed, args.level))
+        result = engine.play(state, POLICIES[args.policy](), random.Random(game_seed))
+        wins += result['status'] == WON
+        total_moves += result['moves']
+    seconds = time.perf_counter() - start_time
+    print(json.dumps({
+        'level': args.level,
+        'policy': args.policy,
+        'games': args.games,
+        'win_rate': wins / args.games if args.games else 0.0,
+        'average_moves': total_moves / args.games if args.games else 0.0,
+        'seconds': round(seconds, 3),
+        'games_per_second': round(args.games / seconds, 1) if seconds else None,
+    }, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,22 @@
 import pygame
+import atexit
 import random
 import sys
 import threading
 import time
-import json
 import os
 import copy  
+import multiprocessing
+import queue
 
 from threading import Lock  # 导入锁用于线程同步
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from collections import OrderedDict
+
+import engine
+import profiler
+import savestore
+import solver
 
 def resource_path(relative_path):
     """获取资源文件的绝对路径，兼容打包后的环境"""
@@ -19,6 +28,17 @@ def resource_path(relative_path):
         base_path = os.path.dirname(os.path.abspath(__file__))
     return os.path.join(base_path, relative_path)
 
+def get_data_directory():
+    """获取存档目录：可用环境变量 GAME_DATA_DIR 指定，打包后保存在用户目录，否则使用脚本所在的目录"""
+    data_dir = os.environ.get('GAME_DATA_DIR')
+    if data_dir:
+        return data_dir
+    if getattr(sys, 'frozen', False):
+        # 打包后的临时目录在退出时会被删除，存档放在用户目录下
+        base_path = os.environ.get('APPDATA') or os.path.expanduser('~')
+        return os.path.join(base_path, 'FeedTheSprite')
+    return os.path.dirname(os.path.abspath(__file__))
+
 
 # 导入锁用于线程同步
 from threading import Lock
@@ -26,8 +46,6 @@ from threading import Lock
 # 获取脚本所在目录，是之前版本的功能，忽略就行
 #BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-pygame.init()
-
 # 屏幕尺寸
 WIDTH, HEIGHT = 1024, 768  # 增大屏幕尺寸
 
@@ -54,14 +72,18 @@ os.makedirs(DATA_DIR, exist_ok=True)
 
 # 定义保存文件路径
 SAVEGAME_FILE = os.path.join(DATA_DIR, 'savegame.json')
+# 存档管理器，存档保存在内存中，由后台线程写入 SAVEGAME_FILE
+save_store = savestore.open_store(SAVEGAME_FILE)
 
 
-# 游戏设置
-TILE_SIZE = 60  # 图案大小
-ROWS, COLS = 8, 8  # 行数和列数
-LAYER_COUNT = 3  # 层数
-MAX_STACK_SIZE = 7  # 栈的最大容量
-MAX_LEVEL = 5  # 最大关卡数
+# 游戏设置，规则相关的常量定义在 engine.py
+TILE_SIZE = engine.TILE_SIZE  # 图案大小
+ROWS, COLS = engine.ROWS, engine.COLS  # 行数和列数
+LAYER_COUNT = engine.LAYER_COUNT  # 层数
+MAX_STACK_SIZE = engine.MAX_STACK_SIZE  # 栈的最大容量
+MAX_LEVEL = engine.MAX_LEVEL  # 最大关卡数
+SOLVABLE_BOARDS = True  # 生成棋盘时确认其有解
+BOARD_GENERATION_BUDGET = 2.0  # 生成一关棋盘的总时间预算（秒）
 
 # 颜色定义
 WHITE = (255, 255, 255)
@@ -73,64 +95,44 @@ BUTTON_TEXT_COLOR = WHITE
 HINT_BUTTON_COLOR = (34, 139, 34)  # Forest Green
 UNDO_BUTTON_COLOR = (178, 34, 34)  # Firebrick
 
-# 初始化屏幕
-screen = pygame.display.set_mode((WIDTH, HEIGHT))
-pygame.display.set_caption("投喂精灵")
+# 屏幕、字体和图片由 init_display() 在主进程中创建
+# 模块被进程池的工作进程重新导入时（spawn、forkserver、打包后的程序）不会打开窗口或加载图片
+screen = None
 
 # 时钟对象
 clock = pygame.time.Clock()
 FPS = 60  # 提高帧率，使动画更流畅
 
-# 加载字体
+# 字体路径，字体在 init_display() 中加载
 font_path = resource_path(os.path.join('fonts', 'NotoSansCJKsc-VF.otf'))  # 使用resource_path获取路径
-try:
-    font = pygame.font.Font(font_path, 24)       # 普通字体
-    title_font = pygame.font.Font(font_path, 48) # 标题字体
-    big_font = pygame.font.Font(font_path, 36)   # 大号字体
-    info_font = pygame.font.Font(font_path, 32)  # 用于分数和关卡
-except FileNotFoundError:
-    print(f"无法加载字体文件: {font_path}")
-    pygame.quit()
-    sys.exit()
-
-# 加载图案图片
-pattern_images = []
-for i in range(1, 9):  # 假设有8种图案
-    image_path = resource_path(f"pattern_{i}.png")
-    if not os.path.exists(image_path):
-        print(f"图案图片不存在: {image_path}")
-        pygame.quit()
-        sys.exit()
-    try:
-        image = pygame.image.load(image_path).convert_alpha()
-        image = pygame.transform.scale(image, (TILE_SIZE, TILE_SIZE))
-        pattern_images.append(image)
-    except pygame.error:
-        print(f"无法加载图案图片: {image_path}")
-        pygame.quit()
-        sys.exit()
+font = None       # 普通字体
+title_font = None # 标题字体
+big_font = None   # 大号字体
+info_font = None  # 用于分数和关卡
+small_font = None  # 小号字体，用于按钮说明和帧耗时叠加层
+
+# 文字渲染缓存，键为 (字体, 文字, 颜色, 是否抗锯齿)，超出容量时淘汰最久未使用的条目
+TEXT_CACHE_SIZE = 256
+text_cache = OrderedDict()
+
+def render_text(font_obj, text, color, antialias=True):
+    """渲染文字，同样的文字只渲染一次"""
+    key = (font_obj, text, tuple(color), antialias)
+    surface = text_cache.get(key)
+    if surface is None:
+        surface = font_obj.render(text, antialias, color)
+        text_cache[key] = surface
+        if len(text_cache) > TEXT_CACHE_SIZE:
+            text_cache.popitem(last=False)
+    else:
+        text_cache.move_to_end(key)
+    return surface
 
-# 加载主菜单背景图片
-menu_background_path = resource_path('menu_background.png')
-try:
-    menu_background = pygame.image.load(menu_background_path).convert()
-    menu_background = pygame.transform.scale(menu_background, (WIDTH, HEIGHT))  # 缩放至屏幕大小
-except pygame.error:
-    print(f"无法加载主菜单背景图片: {menu_background_path}")
-    pygame.quit()
-    sys.exit()
-
-# 加载胜利界面背景图片
-victory_background_path = resource_path('victory_background.png')
-try:
-    victory_background = pygame.image.load(victory_background_path).convert()
-    victory_background = pygame.transform.scale(victory_background, (WIDTH, HEIGHT))  # 缩放至屏幕大小
-except pygame.error:
-    print(f"无法加载胜利界面背景图片: {victory_background_path}")
-    pygame.quit()
-    sys.exit()
+pattern_images = []  # 图案图片，按图案编号 - 1 排列
+menu_background = None  # 主菜单背景图片
+victory_background = None  # 胜利界面背景图片
 
-# 加载角色图片
+# 角色图片
 character_images = [
     {
         'normal': resource_path('character1_normal.png'),
@@ -142,46 +144,164 @@ character_images = [
     }
 ]
 
-# 加载背景图片
+# 背景图片
 background_images = [
     resource_path('bg1.png'),
     resource_path('bg2.png'),
     resource_path('bg3.png')
 ]
-for bg in background_images:
-    if not os.path.exists(bg):
-        print(f"背景图片不存在: {bg}")
-        pygame.quit()
-        sys.exit()
 
-# 加载剧情图片
+# 剧情图片
 story_images = [
     resource_path('story1.png'),
     resource_path('story2.png'),
     resource_path('story3.png')
 ]
-for story in story_images:
-    if not os.path.exists(story):
-        print(f"剧情图片不存在: {story}")
+
+# 角色头像在游戏界面和角色选择界面中的尺寸
+CHARACTER_PORTRAIT_SIZE = (150, 150)
+CHARACTER_OPTION_SIZE = (200, 200)
+
+# 图片缓存，键为 (路径, 尺寸, 是否保留透明通道)，值为已 convert 并缩放好的 Surface
+surface_cache = {}
+
+def get_surface(path, size, alpha=False):
+    """从缓存中取出图片，未命中时加载、转换并缩放一次"""
+    key = (path, size, alpha)
+    surface = surface_cache.get(key)
+    if surface is None:
+        if not os.path.exists(path):
+            print(f"图片不存在: {path}")
+            pygame.quit()
+            sys.exit()
+        try:
+            surface = pygame.image.load(path)
+            surface = surface.convert_alpha() if alpha else surface.convert()
+            surface = pygame.transform.scale(surface, size)
+        except pygame.error:
+            print(f"无法加载图片: {path}")
+            pygame.quit()
+            sys.exit()
+        surface_cache[key] = surface
+    return surface
+
+def preload_surfaces(paths, size, alpha=False):
+    for path in paths:
+        get_surface(path, size, alpha)
+
+def evict_surfaces(paths=None):
+    """从缓存中移除指定路径的所有尺寸版本，paths 为 None 时清空缓存"""
+    if paths is None:
+        surface_cache.clear()
+        return
+    paths = set(paths)
+    for key in [key for key in surface_cache if key[0] in paths]:
+        del surface_cache[key]
+
+# 初始化 pygame，创建窗口并加载字体和图片；只在主进程中调用一次
+def init_display():
+    global screen, font, title_font, big_font, info_font, small_font, menu_background, victory_background
+    pygame.init()
+
+    # 初始化屏幕
+    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    pygame.display.set_caption("投喂精灵")
+
+    # 加载字体
+    try:
+        font = pygame.font.Font(font_path, 24)       # 普通字体
+        title_font = pygame.font.Font(font_path, 48) # 标题字体
+        big_font = pygame.font.Font(font_path, 36)   # 大号字体
+        info_font = pygame.font.Font(font_path, 32)  # 用于分数和关卡
+        small_font = pygame.font.Font(font_path, 16)  # 小号字体
+    except FileNotFoundError:
+        print(f"无法加载字体文件: {font_path}")
         pygame.quit()
         sys.exit()
 
+    # 加载图案图片
+    pattern_images.clear()
+    for i in range(1, 9):  # 假设有8种图案
+        image_path = resource_path(f"pattern_{i}.png")
+        if not os.path.exists(image_path):
+            print(f"图案图片不存在: {image_path}")
+            pygame.quit()
+            sys.exit()
+        try:
+            image = pygame.image.load(image_path).convert_alpha()
+            image = pygame.transform.scale(image, (TILE_SIZE, TILE_SIZE))
+            pattern_images.append(image)
+        except pygame.error:
+            print(f"无法加载图案图片: {image_path}")
+            pygame.quit()
+            sys.exit()
+
+    # 加载主菜单背景图片
+    menu_background_path = resource_path('menu_background.png')
+    try:
+        menu_background = pygame.image.load(menu_background_path).convert()
+        menu_background = pygame.transform.scale(menu_background, (WIDTH, HEIGHT))  # 缩放至屏幕大小
+    except pygame.error:
+        print(f"无法加载主菜单背景图片: {menu_background_path}")
+        pygame.quit()
+        sys.exit()
+
+    # 加载胜利界面背景图片
+    victory_background_path = resource_path('victory_background.png')
+    try:
+        victory_background = pygame.image.load(victory_background_path).convert()
+        victory_background = pygame.transform.scale(victory_background, (WIDTH, HEIGHT))  # 缩放至屏幕大小
+    except pygame.error:
+        print(f"无法加载胜利界面背景图片: {victory_background_path}")
+        pygame.quit()
+        sys.exit()
+
+    for path in background_images + story_images:
+        if not os.path.exists(path):
+            print(f"图片不存在: {path}")
+            pygame.quit()
+            sys.exit()
+
+    # 预加载关卡背景和角色头像，绘制时只从缓存读取
+    preload_surfaces(background_images, (WIDTH, HEIGHT))
+    preload_surfaces([image_dict[state] for image_dict in character_images for state in ('normal', 'happy')],
+                     CHARACTER_PORTRAIT_SIZE, alpha=True)
+
 
 # 全局变量
 stack = []  # 存放玩家点击的图案
-board_layers = []  # 存放多层的图案
+board_tiles = []  # 棋盘上的图案，按格子编号（solver.cell_id）索引，空格为 None
 score = 0  # 玩家得分
 level = 1  # 当前关卡
 
 # 角色名和玩家相关
 player_name = ''
 
-# 定义每层的偏移量，使层与层之间错开
-layer_offsets = [
-    {'x': 0, 'y': 0},  # 底层不偏移
-    {'x': TILE_SIZE // 4, 'y': TILE_SIZE // 4},  # 第二层偏移
-    {'x': TILE_SIZE // 2, 'y': TILE_SIZE // 2},  # 第三层偏移
-]
+CELL_COUNT = engine.CELL_COUNT  # 格子总数
+LAYER_CELLS = engine.LAYER_CELLS  # 每层的格子数
+
+# 棋盘上的一个图案，按身份比较；layer、row、col 和 cell 为它在棋盘上的位置，进入栈后保留，用于撤销
+# board_tiles[tile.cell] is tile 即表示图案在棋盘上；由旧存档恢复、位置未知的栈中图案 cell 为负数
+class Tile:
+    __slots__ = ('number', 'image', 'rect', 'layer', 'row', 'col', 'cell')
+
+    def __init__(self, number, layer=-1, row=-1, col=-1, rect=None):
+        self.number = number
+        self.image = pattern_images[number - 1]
+        self.rect = rect
+        self.layer = layer  # -1 表示位置未知（由旧存档恢复的栈）
+        self.row = row
+        self.col = col
+        self.cell = solver.cell_id(layer, row, col) if layer >= 0 else -1
+
+# 当前关卡的局面（engine.GameState）：遮挡关系、可拿取的格子、栈、消除和胜负判定都由它维护
+# board_tiles 和 stack 是它的显示视图，每次拿取或撤销后由 sync_tile_views 同步
+game_state = None
+cell_tiles = {}  # 格子编号 -> 图案，一关内不变；位置未知的栈中图案使用负编号
+board_version = 0  # 棋盘每次变化（创建、加载、移除、撤销）时递增
+# 点击检测用的网格：按 TILE_SIZE 划分屏幕，(列, 行) -> 矩形与该格相交的 cell 列表，从顶层到底层排列
+# 格子的位置在一关内不变，移除和撤销后只需检查 board_tiles 中该 cell 是否有图案
+tile_buckets = {}
 
 # 定义全局变量，存储游戏区域和栈区域的边界矩形
 game_area_rect = None
@@ -194,7 +314,36 @@ character_reaction_time = 0  # 角色互动状态的剩余时间
 # 提示功能
 hint_sequence = []  # 当前提示的图案序列
 hint_calculating = False  # 是否正在计算提示
+hint_message = ''  # 整关求解的结论，显示在按钮下方
+hint_route = False  # hint_sequence 是否为整关路线，此时按钮下方显示剩余步数
+
+# 最近一次生成棋盘的统计：关卡、种子、尝试次数、耗时（秒）和求解结果
+last_generation_stats = {}
+
+# 本局的随机种子，每关棋盘由它派生，保证可复现
+game_seed = random.getrandbits(32)
+# 当前棋盘每个格子的像素偏移 (dx, dy)，按格子编号索引，随存档保存
+board_jitter = []
+# 当前棋盘的来源 (关卡种子, 尝试次数)，来源相同的棋盘可以沿用置换表
+board_key = None
+# 后台生成下一关棋盘的线程池和当前任务
+board_executor = ThreadPoolExecutor(max_workers=1)
+level_prefetch = None  # {'level': 关卡, 'seed': 种子, 'future': Future}
 hint_lock = Lock()  # 线程锁
+hint_table = solver.TranspositionTable()  # 提示搜索的置换表，同一关内多次提示共用
+# 置换表不是线程安全的：搜索线程在整个搜索期间持有此锁，被取消的旧线程退出前新的搜索在此等待
+hint_table_lock = Lock()
+# 提示计算后端：'thread' 使用线程，'process' 使用进程池，避免与绘制循环争用 GIL
+HINT_BACKEND = 'thread'
+hint_job_id = 0  # 当前提示任务编号，取消时递增
+# 进程后端的工作进程数，大于 1 时单步提示把根节点的走法分给多个进程并行搜索
+HINT_WORKERS = os.cpu_count() or 1
+hint_job_value = multiprocessing.Value('i', 0)  # 与工作进程共享的当前任务编号
+hint_best_value = multiprocessing.Value('i', 0)  # 并行搜索中已找到的最短序列长度
+hint_results = queue.Queue()  # 已完成的提示结果，由主循环轮询
+hint_parts = []  # 当前任务已返回的部分结果
+hint_parts_expected = 1  # 当前任务需要等待的结果数
+hint_process_pool = None
 
 # 按钮尺寸
 BUTTON_WIDTH = 200
@@ -212,168 +361,85 @@ undo_button_rect = pygame.Rect(WIDTH - BUTTON_WIDTH - 40, 90, BUTTON_WIDTH, BUTT
 
 # 加载和保存游戏进度
 def load_game():
-    global player_name, score, level, stack, board_layers, selected_character
-    if os.path.exists(SAVEGAME_FILE):
-        try:
-            with open(SAVEGAME_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                saved_games = data.get('saved_games', [])
-                if not saved_games:
-                    print("没有可继续的游戏。")
-                    return False
-                return True
-        except (json.JSONDecodeError, KeyError, TypeError):
-            print("保存的游戏数据有误，无法加载。")
-    return False
+    if not saved_games_index():
+        print("没有可继续的游戏。")
+        return False
+    return True
 
 def load_specific_game(index):
-    global player_name, score, level, stack, board_layers, selected_character
-    if os.path.exists(SAVEGAME_FILE):
-        try:
-            with open(SAVEGAME_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                saved_games = data.get('saved_games', [])
-                if index < 0 or index >= len(saved_games):
-                    print("选择的游戏不存在。")
-                    return False
-                game_data = saved_games[index]
-                player_name = game_data.get('player_name', '')
-                score = game_data.get('score', 0)
-                level = game_data.get('level', 1)
-                stack_numbers = game_data.get('stack', [])
-                
-                # 重置 stack
-                stack.clear()
-                
-                # 重置 board_layers
-                board_layers_data = game_data.get('board_layers', [])
-                board_layers = []  # 清空现有的 board_layers
-                
-                for layer_data in board_layers_data:
-                    layer = []
-                    for row_data in layer_data:
-                        row = []
-                        for number in row_data:
-                            if number is not None:
-                                tile = {
-                                    'number': number,
-                                    'image': pattern_images[number - 1],
-                                    'rect': None,  # 需要重新计算位置
-                                    'layer': None,  # 需要重新设置
-                                    'original_position': None
-                                }
-                                row.append(tile)
-                            else:
-                                row.append(None)
-                        layer.append(row)
-                    board_layers.append(layer)
-                
-                # 重新计算每个 tile 的 rect 和 layer
-                for layer_num, layer in enumerate(board_layers):
-                    offset = layer_offsets[layer_num]
-                    for row_num, row in enumerate(layer):
-                        for col_num, tile in enumerate(row):
-                            if tile:
-                                rand_offset_x = random.randint(-TILE_SIZE // 8, TILE_SIZE // 8)
-                                rand_offset_y = random.randint(-TILE_SIZE // 8, TILE_SIZE // 8)
-                                tile['rect'] = pygame.Rect(
-                                    col_num * TILE_SIZE + offset['x'] + rand_offset_x + 150,  # 右移，避免遮挡角色
-                                    row_num * TILE_SIZE + offset['y'] + rand_offset_y,
-                                    TILE_SIZE,
-                                    TILE_SIZE
-                                )
-                                tile['layer'] = layer_num
-                
-                # 重新构建 stack based on saved numbers
-                for number in stack_numbers:
-                    # 查找一个未在 stack 中的 tile
-                    found = False
-                    for layer in board_layers:
-                        for row in layer:
-                            for tile in row:
-                                if tile and tile['number'] == number and tile not in stack:
-                                    stack.append(tile)
-                                    remove_tile(tile)
-                                    found = True
-                                    break
-                            if found:
-                                break
-                        if found:
-                            break
-                    if not found:
-                        print(f"无法在棋盘中找到编号为 {number} 的图案以加入栈中。")
-                
-                # 恢复角色选择
-                selected_character = game_data.get('selected_character', 0)
-                return True
-        except (json.JSONDecodeError, KeyError, TypeError) as e:
-            print(f"加载游戏数据时出错: {e}")
-    return False
-
-def save_game():
-    global player_name, score, level, stack, board_layers, selected_character
-    with hint_lock:
-        data = {}
-        if os.path.exists(SAVEGAME_FILE):
-            try:
-                with open(SAVEGAME_FILE, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-            except (json.JSONDecodeError, KeyError, TypeError):
-                data = {}
-        saved_games = data.get('saved_games', [])
-        
-        # 构建当前游戏数据
-        stack_numbers = [tile['number'] for tile in stack]
-        board_layers_data = [
-            [
-                [tile['number'] if tile else None for tile in row]
-                for row in layer
-            ]
-            for layer in board_layers
-        ][:LAYER_COUNT]
-        game_data = {
-            'player_name': player_name,
-            'score': score,
-            'level': level,
-            'stack': stack_numbers,
-            'board_layers': board_layers_data,
-            'selected_character': selected_character
-        }
+    global player_name, score, level, selected_character, game_seed, board_jitter, board_key
+    try:
+        saved_games = save_store.saved_games()
+        if index < 0 or index >= len(saved_games):
+            print("选择的游戏不存在。")
+            return False
+        game_data = saved_games[index]
+        player_name = game_data.get('player_name', '')
+        score = game_data.get('score', 0)
+        level = game_data.get('level', 1)
+        # 旧存档没有种子，换一个新种子，之后的关卡和保存都由它决定
+        game_seed = game_data.get('seed', random.getrandbits(32))
         
-        # 检查是否需要保存
-        if len(saved_games) < 10:
-            saved_games.append(game_data)
-        else:
-            # 找到最低分
-            min_score = min(saved_games, key=lambda x: x['score'])['score']
-            if score > min_score:
-                # 替换最低分的存档
-                for i, game in enumerate(saved_games):
-                    if game['score'] == min_score:
-                        saved_games[i] = game_data
-                        break
+        # 重置棋盘
+        layers, rows, cols, cells, saved_stack, jitter = savestore.decode_board(game_data['board'])
+        if (layers, rows, cols) != (LAYER_COUNT, ROWS, COLS):
+            raise ValueError("存档的棋盘尺寸与当前游戏不一致")
+        # 按保存的像素偏移计算每个图案的位置，旧存档没有偏移时由关卡种子生成
+        board_jitter = jitter if jitter is not None else engine.level_jitter(level_seed(level))
+        tiles = make_tiles(cells, board_jitter)
         
-        # 按分数从高到低排序保存列表
-        saved_games.sort(key=lambda x: x['score'], reverse=True)
+        # 按存档恢复栈，栈中图案的原始位置即撤销记录
+        state_stack = []
+        for index, (cell, number) in enumerate(saved_stack):
+            if cell == savestore.NO_CELL:
+                cell = -1 - index
+                tiles[cell] = Tile(number)
+                tiles[cell].cell = cell
+            else:
+                tiles.update(make_tiles({cell: number}, board_jitter))
+            state_stack.append((cell, number))
         
-        # 限制保存列表最多为10个
-        if len(saved_games) > 10:
-            saved_games = saved_games[:10]
+        install_game_state(engine.GameState(level, cells, board_jitter, MAX_STACK_SIZE, state_stack), tiles)
+        # 布局可复现，同一来源的棋盘沿用已有的搜索结果
+        key = (level_seed(level), game_data['attempt']) if 'seed' in game_data and 'attempt' in game_data else None
+        cancel_hint()
+        if key is None or key != board_key:
+            clear_hint_table()
+        board_key = key
+        # 在后台准备下一关
+        prefetch_next_level()
         
-        data['saved_games'] = saved_games
-        with open(SAVEGAME_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
+        # 恢复角色选择
+        selected_character = game_data.get('selected_character', 0)
+        return True
+    except (KeyError, TypeError, IndexError, ValueError) as e:
+        print(f"加载游戏数据时出错: {e}")
+    return False
+
+# 保存游戏进度：只更新内存中的存档，由存档管理器在后台写盘
+def save_game():
+    global player_name, score, level, selected_character
+    # 构建当前游戏数据
+    # 栈中图案连同原始位置一起保存，加载后可以继续撤销
+    stack_data = [(cell if cell >= 0 else savestore.NO_CELL, number) for cell, number in game_state.stack]
+    # 棋盘按格子编号顺序打包为每格一个字节的图案编号
+    cells = bytes(game_state.kinds)
+    game_data = {
+        'player_name': player_name,
+        'score': score,
+        'level': level,
+        'board': savestore.encode_board(cells, LAYER_COUNT, ROWS, COLS, stack_data, board_jitter),
+        'selected_character': selected_character,
+        'seed': game_seed
+    }
+    if board_key is not None:
+        game_data['attempt'] = board_key[1]
+    save_store.record(game_data)
 
 # 显示剧情介绍并可按空格键或点击继续
 def show_story():
     for image_file in story_images:
-        try:
-            story_image = pygame.image.load(image_file).convert()
-            story_image = pygame.transform.scale(story_image, (WIDTH, HEIGHT))
-        except pygame.error:
-            print(f"无法加载剧情图片: {image_file}")
-            pygame.quit()
-            sys.exit()
+        story_image = get_surface(image_file, (WIDTH, HEIGHT))
         showing = True
         while showing:
             for event in pygame.event.get():
@@ -388,19 +454,15 @@ def show_story():
             screen.blit(story_image, (0, 0))
             pygame.display.flip()
             clock.tick(FPS)
+    # 剧情只显示一次，释放其占用的内存
+    evict_surfaces(story_images)
 
 # 角色选择功能
 def select_character():
     global selected_character
     character_options = []
     for idx, image_dict in enumerate(character_images):
-        try:
-            character_image = pygame.image.load(image_dict['normal']).convert_alpha()
-            character_image = pygame.transform.scale(character_image, (200, 200))
-        except pygame.error:
-            print(f"无法加载角色图片: {image_dict['normal']}")
-            pygame.quit()
-            sys.exit()
+        character_image = get_surface(image_dict['normal'], CHARACTER_OPTION_SIZE, alpha=True)
         rect = character_image.get_rect(center=(WIDTH / (len(character_images)+1) * (idx + 1), HEIGHT / 2))
         character_options.append({'image': character_image, 'rect': rect, 'index': idx})
     
@@ -414,7 +476,7 @@ def select_character():
             screen.blit(char['image'], char['rect'])
         
         # 绘制提示文字
-        prompt_text = font.render("请选择一个角色", True, BLACK)
+        prompt_text = render_text(font, "请选择一个角色", BLACK)
         screen.blit(prompt_text, (WIDTH / 2 - prompt_text.get_width() / 2, HEIGHT / 2 - 250))
         
         pygame.display.flip()
@@ -470,177 +532,178 @@ def input_character_name():
         screen.blit(menu_background, (0, 0))
         
         # 绘制提示文字
-        prompt_text = font.render("请输入角色名:", True, BLACK)
+        prompt_text = render_text(font, "请输入角色名:", BLACK)
         screen.blit(prompt_text, (WIDTH / 2 - prompt_text.get_width() / 2, HEIGHT / 2 - 60))
 
         # 绘制输入框
         pygame.draw.rect(screen, color, input_box, 2)
-        text_surface = font.render(user_text, True, BLACK)
+        text_surface = render_text(font, user_text, BLACK)
         screen.blit(text_surface, (input_box.x + 5, input_box.y + 5))
 
         pygame.display.flip()
         clock.tick(30)
 
 # 启动新游戏
-def start_new_game(name):
-    global player_name, current_state, score, level, stack
+def start_new_game(name, seed=None):
+    global player_name, current_state, score, level, game_seed
     player_name = name
     score = 0
     level = 1
-    stack = []
+    game_seed = random.getrandbits(32) if seed is None else seed
     create_board()
     current_state = STATE_GAME
     save_game()  # 保存游戏进度
 
+# 本局第 level_num 关的种子，见 engine.level_seed
+def level_seed(level_num):
+    return engine.level_seed(game_seed, level_num)
+
+# 计算格子上图案的矩形
+def tile_rect(cell, jitter):
+    return pygame.Rect(engine.cell_position(cell, jitter), (TILE_SIZE, TILE_SIZE))
+
+# 按格子编号排列的图案编号（0 为空）创建棋盘上的图案，返回 格子编号 -> 图案
+# kinds 也可以是 格子编号 -> 图案编号 的字典
+def make_tiles(kinds, jitter):
+    items = kinds.items() if isinstance(kinds, dict) else enumerate(kinds)
+    tiles = {}
+    for cell, number in items:
+        if number:
+            layer, row, col = solver.cell_coords(cell)
+            tiles[cell] = Tile(number, layer, row, col, tile_rect(cell, jitter))
+    return tiles
+
+# 用 engine.generate_layout 生成一关棋盘，再创建局面和图案对象；可以在后台线程中调用
+def generate_board(level_num, seed, solvable, time_budget):
+    kinds, jitter, stats = engine.generate_layout(level_num, seed, solvable, time_budget)
+    if solvable and stats['status'] != solver.SOLVE_SOLVED:
+        print(f"第 {level_num} 关在 {time_budget} 秒内未能确认有解，使用最后一次生成的棋盘")
+    return engine.GameState(level_num, kinds, jitter, MAX_STACK_SIZE), make_tiles(kinds, jitter), stats
+
+# 在后台线程中预先生成下一关的棋盘
+def prefetch_next_level():
+    global level_prefetch
+    next_level_num = level + 1
+    if next_level_num > MAX_LEVEL:
+        level_prefetch = None
+        return
+    seed = level_seed(next_level_num)
+    future = board_executor.submit(generate_board, next_level_num, seed,
+                                   SOLVABLE_BOARDS, BOARD_GENERATION_BUDGET)
+    level_prefetch = {'level': next_level_num, 'seed': seed, 'future': future}
+
 # 创建棋盘
-def create_board():
-    global board_layers, game_area_rect
-    board_layers = []
-    
-    # 动态调整图案种类数量
-    max_tile_kinds = 8  # 最大图案种类数
-    tile_kinds = min(6 + level - 1, max_tile_kinds)  # 随着关卡提升增加图案种类
+# 如果后台已经为当前关卡生成了棋盘则直接使用，否则在当前线程中生成
+def create_board(solvable=None, time_budget=None):
+    global last_generation_stats, level_prefetch, board_jitter, board_key
+    if solvable is None:
+        solvable = SOLVABLE_BOARDS
+    if time_budget is None:
+        time_budget = BOARD_GENERATION_BUDGET
+    cancel_hint()
+    clear_hint_table()  # 新棋盘，旧的搜索结果不再有效
+
+    tile_kinds, _ = engine.level_tiles(level)
     print(f"第 {level} 关，图案种类数：{tile_kinds}")
 
-    # 动态调整每种图案的数量
-    base_tiles_per_kind = 6  # 基础每种图案数量
-    tiles_per_kind = base_tiles_per_kind + (level - 1) * 2  # 每关增加2个
-
-    # 确保每种图案的数量是3的倍数
-    tiles_per_kind = max(3, tiles_per_kind)  # 确保至少为3
-    tiles_per_kind = ((tiles_per_kind + 2) // 3) * 3  # 调整为3的倍数
-
-    # 生成图案序列
-    total_tiles = []
-    for i in range(1, tile_kinds + 1):
-        total_tiles.extend([i] * tiles_per_kind)
-
-    # 计算总的图案数量
-    total_tiles_count = len(total_tiles)
-
-    # 检查总的图案数量是否超过可用位置数量
-    total_positions = ROWS * COLS * LAYER_COUNT
-    if total_tiles_count > total_positions:
-        # 需要减少每种图案的数量
-        reduction_factor = total_positions / total_tiles_count
-        tiles_per_kind = int(tiles_per_kind * reduction_factor) // 3 * 3  # 调整为3的倍数
-        tiles_per_kind = max(3, tiles_per_kind)  # 确保至少为3
-
-        # 重新生成图案序列
-        total_tiles = []
-        for i in range(1, tile_kinds + 1):
-            total_tiles.extend([i] * tiles_per_kind)
-        total_tiles_count = len(total_tiles)
-
-    # 打乱图案序列
-    random.shuffle(total_tiles)
-
-    # 初始化层列表
-    for _ in range(LAYER_COUNT):
-        board_layers.append([[None for _ in range(COLS)] for _ in range(ROWS)])
-
-    # 定义所有可能的位置
-    positions = []
-    for layer_num in range(LAYER_COUNT):
-        offset = layer_offsets[layer_num]
-        for row in range(ROWS):
-            for col in range(COLS):
-                positions.append({
-                    'layer': layer_num,
-                    'row': row,
-                    'col': col,
-                    'offset_x': offset['x'],
-                    'offset_y': offset['y']
-                })
-
-    # 打乱位置列表
-    random.shuffle(positions)
-
-    # 放置图案到棋盘上
-    index = 0
-    for tile_number in total_tiles:
-        if index >= len(positions):
-            break  # 没有更多位置了
-
-        pos = positions[index]
-        index += 1
-        layer = pos['layer']
-        row = pos['row']
-        col = pos['col']
-
-        if board_layers[layer][row][col] is None:
-            # 随机小偏移，增加自然感
-            rand_offset_x = random.randint(-TILE_SIZE // 8, TILE_SIZE // 8)
-            rand_offset_y = random.randint(-TILE_SIZE // 8, TILE_SIZE // 8)
-            tile = {
-                'number': tile_number,
-                'image': pattern_images[tile_number - 1],
-                'rect': pygame.Rect(
-                    col * TILE_SIZE + pos['offset_x'] + rand_offset_x + 150,  # 右移，避免遮挡角色
-                    row * TILE_SIZE + pos['offset_y'] + rand_offset_y,
-                    TILE_SIZE,
-                    TILE_SIZE
-                ),
-                'layer': layer,
-                'original_position': None
-            }
-            board_layers[layer][row][col] = tile
-
-    # 在放置图案后，计算游戏区域的边界
-    all_tiles_rects = []
-    for layer in board_layers:
-        for row in layer:
-            for tile in row:
-                if tile:
-                    all_tiles_rects.append(tile['rect'])
-    # 合并所有图案的矩形，得到游戏区域的边界
+    seed = level_seed(level)
+    prefetch = level_prefetch
+    level_prefetch = None
+    start_time = time.perf_counter()
+    if prefetch and prefetch['level'] == level and prefetch['seed'] == seed and solvable == SOLVABLE_BOARDS:
+        # 后台尚未完成时等待它，而不是从头重新生成
+        state, tiles, last_generation_stats = prefetch['future'].result()
+    else:
+        state, tiles, last_generation_stats = generate_board(level, seed, solvable, time_budget)
+    handoff = time.perf_counter() - start_time
+    print(f"第 {level} 关生成用时 {last_generation_stats['seconds']:.3f} 秒，"
+          f"尝试 {last_generation_stats['attempts']} 次，求解结果：{last_generation_stats['status']}，"
+          f"切换等待 {handoff:.3f} 秒")
+    board_jitter = state.jitter
+    board_key = (seed, last_generation_stats['attempts'])
+    install_game_state(state, tiles)
+
+    # 玩当前关卡时在后台准备下一关
+    prefetch_next_level()
+
+# 合并图案的矩形，得到它们的边界，默认为棋盘上的图案
+def board_bounds(tiles=None):
+    if tiles is None:
+        tiles = board_tiles
+    all_tiles_rects = [tile.rect for tile in tiles if tile]
     if all_tiles_rects:
-        game_area_rect = all_tiles_rects[0].copy()
+        bounds = all_tiles_rects[0].copy()
         for rect in all_tiles_rects[1:]:
-            game_area_rect.union_ip(rect)
-    else:
-        game_area_rect = pygame.Rect(0, 0, 0, 0)
+            bounds.union_ip(rect)
+        return bounds
+    return pygame.Rect(0, 0, 0, 0)
+
+# 换上新的局面（创建或加载棋盘时调用），tiles 为 格子编号 -> 图案，包含棋盘和栈中的图案
+# 布局由关卡种子决定，图案只会回到原来的格子，所以点击检测索引和图案对象在一关内不变
+def install_game_state(state, tiles):
+    global game_state, game_area_rect
+    game_state = state
+    cell_tiles.clear()
+    cell_tiles.update(tiles)
+    board_tiles[:] = [None] * CELL_COUNT
+    build_tile_buckets()
+    sync_tile_views()
+    # 在放置图案后，计算游戏区域的边界；栈中可以撤销放回的图案也在其中，否则放回后不在重绘区域内
+    game_area_rect = board_bounds([tile for cell, tile in cell_tiles.items() if cell >= 0])
+
+# 按局面同步棋盘和栈中显示的图案
+def sync_tile_views():
+    global board_version
+    board_version += 1
+    for cell, number in enumerate(game_state.kinds):
+        board_tiles[cell] = cell_tiles[cell] if number else None
+    stack[:] = [cell_tiles[cell] for cell, _ in game_state.stack]
+
+# 按图案矩形覆盖的网格建立点击检测索引，栈中的图案可能被撤销放回，也要加入索引
+def build_tile_buckets():
+    tile_buckets.clear()
+    # 与逐层扫描的顺序一致：层高的在前，同层按格子编号
+    for cell in sorted((cell for cell in cell_tiles if cell >= 0),
+                       key=lambda cell: (-(cell // LAYER_CELLS), cell)):
+        rect = cell_tiles[cell].rect
+        for bucket_x in range(rect.left // TILE_SIZE, (rect.right - 1) // TILE_SIZE + 1):
+            for bucket_y in range(rect.top // TILE_SIZE, (rect.bottom - 1) // TILE_SIZE + 1):
+                tile_buckets.setdefault((bucket_x, bucket_y), []).append(cell)
 
 # 检查图案是否未被覆盖
 def is_tile_uncovered(tile):
-    tile_rect = tile['rect']
-    tile_layer = tile['layer']
-    for higher_layer in board_layers[tile_layer + 1:]:
-        for row in higher_layer:
-            for other_tile in row:
-                if other_tile:
-                    other_rect = other_tile['rect']
-                    # 判断上层图案的四个角是否在当前图案的范围内
-                    for corner in [(other_rect.left, other_rect.top),
-                                   (other_rect.right, other_rect.top),
-                                   (other_rect.left, other_rect.bottom),
-                                   (other_rect.right, other_rect.bottom)]:
-                        if tile_rect.collidepoint(corner):
-                            return False
-    return True
+    return tile.cell in game_state.free
 
 # 绘制背景
 def draw_background():
     bg_image_file = background_images[(level - 1) % len(background_images)]
-    try:
-        bg_image = pygame.image.load(bg_image_file).convert()
-        bg_image = pygame.transform.scale(bg_image, (WIDTH, HEIGHT))
-    except pygame.error:
-        print(f"无法加载背景图片: {bg_image_file}")
-        pygame.quit()
-        sys.exit()
-    screen.blit(bg_image, (0, 0))
+    screen.blit(get_surface(bg_image_file, (WIDTH, HEIGHT)), (0, 0))
 
 # 绘制棋盘
+# 棋盘合成图：所有图案按层叠顺序预先画到一张离屏 Surface 上，棋盘变化时才重建
+board_surface = None
+board_surface_rect = None
+board_surface_version = -1
+
+def rebuild_board_surface():
+    global board_surface, board_surface_rect, board_surface_version
+    # 图案被移走后边界可能缩小，所以每次按当前图案重新计算边界
+    board_surface_rect = board_bounds()
+    board_surface = pygame.Surface(board_surface_rect.size, pygame.SRCALPHA).convert_alpha()
+    origin_x, origin_y = board_surface_rect.topleft
+    # 格子编号按层排列，顺序绘制即为从底层到顶层
+    for tile in board_tiles:
+        if tile:
+            board_surface.blit(tile.image, tile.rect.move(-origin_x, -origin_y))
+    board_surface_version = board_version
+
 def draw_board():
-    for layer in board_layers:
-        for row in layer:
-            for tile in row:
-                if tile:
-                    screen.blit(tile['image'], tile['rect'])
-                    # 如果是提示的图案，绘制高亮边框
-                    if hint_sequence and tile == hint_sequence[0]:
-                        pygame.draw.rect(screen, (255, 0, 0), tile['rect'], 3)
+    if board_surface is None or board_surface_version != board_version:
+        rebuild_board_surface()
+    screen.blit(board_surface, board_surface_rect)
+    # 提示的图案在合成图之上绘制高亮边框
+    if hint_sequence:
+        pygame.draw.rect(screen, (255, 0, 0), hint_sequence[0].rect, 3)
 
 # 绘制栈
 def draw_stack():
@@ -650,7 +713,7 @@ def draw_stack():
     stack_area_rect = pygame.Rect(x - 10, y - 10, (TILE_SIZE + 5) * MAX_STACK_SIZE + 20, TILE_SIZE + 20)
     pygame.draw.rect(screen, (100, 150, 200), stack_area_rect, 5, border_radius=15)
     for i, tile in enumerate(stack):
-        screen.blit(tile['image'], (x + i * (TILE_SIZE + 5), y))
+        screen.blit(tile.image, (x + i * (TILE_SIZE + 5), y))
 
 # 绘制角色和信息
 def draw_game_elements():
@@ -670,21 +733,11 @@ def draw_game_elements():
         character_image_file = character_images[selected_character]['normal']
     else:
         character_image_file = character_images[selected_character]['happy']
-    if not os.path.exists(character_image_file):
-        print(f"角色图片不存在: {character_image_file}")
-        pygame.quit()
-        sys.exit()
-    try:
-        character_image = pygame.image.load(character_image_file).convert_alpha()
-        character_image = pygame.transform.scale(character_image, (150, 150))
-    except pygame.error:
-        print(f"无法加载角色图片: {character_image_file}")
-        pygame.quit()
-        sys.exit()
+    character_image = get_surface(character_image_file, CHARACTER_PORTRAIT_SIZE, alpha=True)
     screen.blit(character_image, (20, HEIGHT - 170))  # 左下角显示角色
     # 绘制分数和关卡信息
-    score_text = info_font.render(f"分数: {score}", True, BLACK)
-    level_text = info_font.render(f"关卡: {level}", True, BLACK)
+    score_text = render_text(info_font, f"分数: {score}", BLACK)
+    level_text = render_text(info_font, f"关卡: {level}", BLACK)
     
     # 添加边框背景
     score_rect = score_text.get_rect(topleft=(WIDTH - 220, HEIGHT - 100))
@@ -705,158 +758,220 @@ def draw_game_elements():
     # 绘制提示按钮
     with hint_lock:
         if hint_calculating:
-            hint_text = font.render("计算中...", True, BUTTON_TEXT_COLOR)
+            hint_text = render_text(font, "计算中...", BUTTON_TEXT_COLOR)
         else:
-            hint_text = font.render("提示", True, BUTTON_TEXT_COLOR)
+            hint_text = render_text(font, "提示", BUTTON_TEXT_COLOR)
     pygame.draw.rect(screen, HINT_BUTTON_COLOR, hint_button_rect, border_radius=10)
     screen.blit(hint_text, (hint_button_rect.centerx - hint_text.get_width() / 2,
                             hint_button_rect.centery - hint_text.get_height() / 2))
+    # 右键是整关求解的唯一入口，在按钮旁说明
+    tip_text = render_text(small_font, "右键：整关求解", BLACK)
+    tip_rect = tip_text.get_rect(midright=(hint_button_rect.left - 12, hint_button_rect.centery))
+    pygame.draw.rect(screen, WHITE, tip_rect.inflate(8, 4), border_radius=4)
+    screen.blit(tip_text, tip_rect)
     # 绘制撤销按钮
-    undo_text = font.render("撤销", True, BUTTON_TEXT_COLOR)
+    undo_text = render_text(font, "撤销", BUTTON_TEXT_COLOR)
     pygame.draw.rect(screen, UNDO_BUTTON_COLOR, undo_button_rect, border_radius=10)
     screen.blit(undo_text, (undo_button_rect.centerx - undo_text.get_width() / 2,
                             undo_button_rect.centery - undo_text.get_height() / 2))
+    # 绘制整关求解的结论
+    message = current_hint_message()
+    if message:
+        message_text = render_text(font, message, BLACK)
+        message_rect = message_text.get_rect(midtop=(undo_button_rect.centerx, undo_button_rect.bottom + 20))
+        pygame.draw.rect(screen, WHITE, message_rect.inflate(10, 10))
+        pygame.draw.rect(screen, BLACK, message_rect.inflate(10, 10), 2)
+        screen.blit(message_text, message_rect)
+
+# 帧耗时统计：主循环按阶段计时，按 F3 显示或隐藏叠加层
+# 设置环境变量 GAME_FRAME_TRACE 为文件路径时，每一帧的耗时追加写入该 JSONL 文件
+PROFILER_OVERLAY_KEY = pygame.K_F3
+PROFILER_OVERLAY_REFRESH = 15  # 叠加层每隔多少帧更新一次数字
+PROFILER_OVERLAY_RECT = pygame.Rect(10, 10, 290, 310)
+PROFILER_BAR_WIDTH = 150
+frame_profiler = profiler.FrameProfiler(trace_path=os.environ.get('GAME_FRAME_TRACE'))
+atexit.register(frame_profiler.close)
+profiler_overlay_visible = False
+profiler_overlay_surface = None
+profiler_overlay_frame = -1  # 叠加层上一次更新时的帧号
+
+def toggle_profiler_overlay():
+    global profiler_overlay_visible
+    profiler_overlay_visible = not profiler_overlay_visible
+
+# 按最近若干帧的统计重新绘制叠加层：各阶段的 p50/p95/p99 和帧时间分布
+def build_profiler_overlay():
+    panel = pygame.Surface(PROFILER_OVERLAY_RECT.size)
+    panel.fill((30, 30, 30))
+    color = (230, 230, 230)
+    line_height = small_font.get_linesize()
+    columns = (100, 160, 220)
+
+    def row(y, label, values):
+        # 数字每帧都在变化，直接渲染而不进入文字缓存
+        panel.blit(small_font.render(label, True, color), (8, y))
+        for x, value in zip(columns, values):
+            panel.blit(small_font.render(value, True, color), (x, y))
+
+    y = 6
+    row(y, "毫秒", ("p50", "p95", "p99"))
+    y += line_height
+    for name in (None,) + profiler.SECTIONS:
+        row(y, name or "frame", [f"{value:.2f}" for value in frame_profiler.percentiles(name)])
+        y += line_height
+    y += line_height // 2
+    histogram = frame_profiler.histogram()
+    most = max(count for _, count in histogram) or 1
+    for bound, count in histogram:
+        label = f"<={bound:g}" if bound is not None else f">{profiler.HISTOGRAM_BOUNDS[-1]:g}"
+        panel.blit(small_font.render(label, True, color), (8, y))
+        # 在一帧的时间预算内的区间为绿色
+        bar_color = (80, 180, 80) if bound is not None and bound <= round(1000 / FPS, 1) else (200, 80, 60)
+        pygame.draw.rect(panel, bar_color, (70, y + 3, max(1, PROFILER_BAR_WIDTH * count // most), line_height - 6))
+        panel.blit(small_font.render(str(count), True, color), (75 + PROFILER_BAR_WIDTH, y))
+        y += line_height
+    return panel
+
+# 显示叠加层时定期更新内容，返回叠加层的版本（隐藏时为 None）
+def update_profiler_overlay():
+    global profiler_overlay_surface, profiler_overlay_frame
+    if not profiler_overlay_visible:
+        return None
+    if (profiler_overlay_surface is None
+            or frame_profiler.frame_count - profiler_overlay_frame >= PROFILER_OVERLAY_REFRESH):
+        profiler_overlay_surface = build_profiler_overlay()
+        profiler_overlay_frame = frame_profiler.frame_count
+    return profiler_overlay_frame
+
+def draw_profiler_overlay():
+    if profiler_overlay_visible and profiler_overlay_surface is not None:
+        screen.blit(profiler_overlay_surface, PROFILER_OVERLAY_RECT)
+
+# 按钮下方显示的提示信息；整关路线的剩余步数随玩家沿路线点击而减少，走完后不再显示
+def current_hint_message():
+    if hint_route:
+        return f"可以通关，剩余 {len(hint_sequence)} 步" if hint_sequence else ''
+    return hint_message
+
+# 脏矩形渲染：记录上一次绘制时各区域的状态，只重绘状态发生变化的区域
+game_render_state = {}
+game_screen_valid = False  # 为 False 时下一帧整屏重绘
+
+# 其他界面覆盖了游戏画面后调用，下一帧整屏重绘
+def invalidate_game_screen():
+    global game_screen_valid
+    game_screen_valid = False
+
+# 返回 {区域名: (区域矩形, 区域状态)}，状态改变即说明该区域需要重绘
+def game_render_regions():
+    hint_tile = id(hint_sequence[0]) if hint_sequence else None
+    return {
+        'board': (game_area_rect.inflate(30, 30), (board_version, hint_tile)),
+        'stack': (stack_area_rect.inflate(10, 10), tuple(id(tile) for tile in stack)),
+        'character': (pygame.Rect(20, HEIGHT - 170, *CHARACTER_PORTRAIT_SIZE), character_state),
+        'info': (pygame.Rect(WIDTH - 230, HEIGHT - 110, 230, 110), (score, level)),
+        'hint_button': (hint_button_rect, hint_calculating),
+        'hint_message': (pygame.Rect(WIDTH - 440, undo_button_rect.bottom + 10, 440, 60), current_hint_message()),
+        'profiler': (PROFILER_OVERLAY_RECT, update_profiler_overlay()),
+    }
 
-# 获取点击位置的图案
-def get_tile_at_pos(pos, board_layers_param=None):
-    if board_layers_param is None:
-        board_layers_param = board_layers
-    for layer in reversed(board_layers_param):  # 从顶层开始检测
-        for row in layer:
-            for tile in row:
-                if tile and tile['rect'].collidepoint(pos):
-                    return tile
+# 绘制游戏界面，只把变化的区域推送到屏幕
+def render_game():
+    global game_screen_valid, game_render_state
+    layout = (level, selected_character, tuple(game_area_rect) if game_area_rect else None)
+    if not game_screen_valid or stack_area_rect is None or game_render_state.get('layout') != layout:
+        update_profiler_overlay()
+        draw_game_elements()
+        handle_animations()
+        draw_profiler_overlay()
+        with frame_profiler.section('flip'):
+            pygame.display.flip()
+        game_render_state = {name: state for name, (_, state) in game_render_regions().items()}
+        game_render_state['layout'] = layout
+        game_screen_valid = True
+        return
+    dirty_rects = []
+    for name, (rect, state) in game_render_regions().items():
+        if game_render_state.get(name) != state:
+            game_render_state[name] = state
+            dirty_rects.append(rect)
+    if not dirty_rects:
+        return  # 画面没有变化，本帧不绘制
+    for rect in dirty_rects:
+        screen.set_clip(rect)
+        draw_game_elements()
+        handle_animations()
+    screen.set_clip(None)
+    draw_profiler_overlay()  # 叠加层始终在最上面
+    with frame_profiler.section('flip'):
+        pygame.display.update(dirty_rects)
+
+# 获取点击位置的最上层图案，当前棋盘只检查该位置所在网格中的候选格子
+def get_tile_at_pos(pos, board_param=None):
+    if board_param is None or board_param is board_tiles:
+        for cell in tile_buckets.get((int(pos[0]) // TILE_SIZE, int(pos[1]) // TILE_SIZE), ()):
+            tile = board_tiles[cell]
+            if tile and tile.rect.collidepoint(pos):
+                return tile
+        return None
+    for layer_num in reversed(range(LAYER_COUNT)):  # 从顶层开始检测
+        for tile in board_param[layer_num * LAYER_CELLS:(layer_num + 1) * LAYER_CELLS]:
+            if tile and tile.rect.collidepoint(pos):
+                return tile
     return None
 
-# 移除图案
-def remove_tile(tile):
-    for layer in board_layers:
-        for row in layer:
-            for i in range(len(row)):
-                if row[i] == tile:
-                    row[i] = None
-                    return
-
 # 处理点击事件
 def handle_click(pos):
-    global hint_sequence
+    global hint_sequence, hint_message, hint_route, score, character_state, character_reaction_time
     tile = get_tile_at_pos(pos)
     if tile:
         # 检查图案是否被覆盖
         if is_tile_uncovered(tile):
+            cancel_hint()  # 棋盘即将变化，正在计算的提示已经过期
             with hint_lock:
                 # 检查玩家是否点击了提示的图案
-                if hint_sequence and tile == hint_sequence[0]:
+                if hint_sequence and tile is hint_sequence[0]:
                     hint_sequence.pop(0)  # 移除已提示的图案
                     if not hint_sequence:
                         hint_sequence = []  # 提示序列已用完
                 else:
                     hint_sequence = []  # 玩家未点击提示的图案，清空提示序列
-
-            # 记录原始位置
-            tile['original_position'] = {'layer': tile['layer'], 'row': None, 'col': None}
-            # 找到该 tile 在 board_layers 中的位置
-            for row_idx, row in enumerate(board_layers[tile['layer']]):
-                for col_idx, t in enumerate(row):
-                    if t == tile:
-                        tile['original_position']['row'] = row_idx
-                        tile['original_position']['col'] = col_idx
-                        break
-            stack.append(tile)
-            remove_tile(tile)
-
-            if len(stack) > MAX_STACK_SIZE:
-                game_over("栈已满，游戏失败！")
-            else:
-                if len(stack) >= 3:
-                    check_match()
-                # 检查游戏状态
-                if is_game_won():
-                    if level >= MAX_LEVEL:
-                        game_win("恭喜您完成所有关卡，游戏胜利！")
-                    else:
-                        next_level()
-                elif is_game_over():
-                    game_over("无法继续，游戏失败！")
-        else:
-            pass  # 图案被覆盖，无法点击
-
-# 检查匹配
-def check_match():
-    global stack, score, character_state, character_reaction_time, hint_sequence
-    changed = True
-    while changed and len(stack) >= 3:
-        changed = False
-        counts = {}
-        for tile in stack:
-            counts[tile['number']] = counts.get(tile['number'], 0) + 1
-        for number, count in counts.items():
-            while count >= 3:
-                # 移除三个相同的图案
-                remove_count = 0
-                i = len(stack) - 1
-                while i >= 0 and remove_count < 3:
-                    if stack[i]['number'] == number:
-                        del stack[i]
-                        remove_count += 1
-                        count -= 1
-                    i -= 1
-                score += 100
+                    hint_message = ''
+                    hint_route = False
+
+            # 拿取、消除和胜负判定由局面完成，图案保留自己的棋盘位置，撤销时放回原处
+            level_score = game_state.score
+            game_state.pick(tile.cell)
+            sync_tile_views()
+            if game_state.score > level_score:
+                score += game_state.score - level_score
                 # 角色互动动画
                 character_state = 'happy'
                 character_reaction_time = int(FPS * 1)  # 互动状态持续1秒
-                # 清空提示序列
-                with hint_lock:
-                    hint_sequence = []
-                changed = True
-                break  # 重新检查
-        if changed:
-            continue
-        else:
-            break
-
-# 判断游戏是否胜利
-def is_game_won():
-    # 如果棋盘上没有任何图案，且栈为空，游戏胜利
-    for layer in board_layers:
-        for row in layer:
-            for tile in row:
-                if tile:
-                    return False
-    if len(stack) == 0:
-        return True
-    else:
-        return False
 
-# 判断游戏是否失败
-def is_game_over():
-    # 如果棋盘上没有图案，但栈中有剩余图案无法匹配，游戏失败
-    for layer in board_layers:
-        for row in layer:
-            for tile in row:
-                if tile:
-                    return False  # 仍有图案，游戏未结束
-    if len(stack) > 0:
-        # 检查栈中的图案能否再匹配
-        counts = {}
-        for tile in stack:
-            counts[tile['number']] = counts.get(tile['number'], 0) + 1
-        for count in counts.values():
-            if count >= 3:
-                return False  # 仍有可能匹配
-        return True  # 无法匹配，游戏失败
-    return False
+            # 检查游戏状态
+            if game_state.status == engine.WON:
+                if level >= MAX_LEVEL:
+                    game_win("恭喜您完成所有关卡，游戏胜利！")
+                else:
+                    next_level()
+            elif game_state.status == engine.LOST:
+                # 栈溢出，或棋盘已清空而栈中剩余的图案无法消除
+                game_over("栈已满，游戏失败！" if len(stack) > MAX_STACK_SIZE else "无法继续，游戏失败！")
+        else:
+            pass  # 图案被覆盖，无法点击
 
 # 进入下一关
 def next_level():
-    global level, stack, hint_sequence
+    global level, hint_sequence, hint_message, hint_route
     level += 1
     if level > MAX_LEVEL:
         game_win("恭喜您完成所有关卡，游戏胜利！")
     else:
-        stack = []  # 重置栈
         with hint_lock:
             hint_sequence = []
+            hint_message = ''
+            hint_route = False
         create_board()
         save_game()  # 保存游戏进度
 
@@ -864,7 +979,7 @@ def next_level():
 def game_over(message):
     global current_state
     screen.fill(BG_COLOR)
-    message_text = big_font.render(message, True, (178, 34, 34))  # Firebrick
+    message_text = render_text(big_font, message, (178, 34, 34))  # Firebrick
     rect = message_text.get_rect(center=(WIDTH / 2, HEIGHT / 2 - 50))
     screen.blit(message_text, rect)
 
@@ -872,7 +987,7 @@ def game_over(message):
     save_game()
 
     # 显示返回主菜单的提示
-    return_text = font.render("返回主菜单...", True, BLACK)
+    return_text = render_text(font, "返回主菜单...", BLACK)
     return_rect = return_text.get_rect(center=(WIDTH / 2, HEIGHT / 2 + 50))
     screen.blit(return_text, return_rect)
 
@@ -889,7 +1004,7 @@ def game_win(message):
     screen.blit(victory_background, (0, 0))
 
     # 绘制胜利消息
-    message_text = big_font.render(message, True, (34, 139, 34))  # Forest Green
+    message_text = render_text(big_font, message, (34, 139, 34))  # Forest Green
     rect = message_text.get_rect(center=(WIDTH / 2, HEIGHT / 2 - 50))
     screen.blit(message_text, rect)
 
@@ -897,7 +1012,7 @@ def game_win(message):
     save_game()
 
     # 显示返回主菜单的提示
-    return_text = font.render("返回主菜单...", True, BLACK)
+    return_text = render_text(font, "返回主菜单...", BLACK)
     return_rect = return_text.get_rect(center=(WIDTH / 2, HEIGHT / 2 + 50))
     screen.blit(return_text, return_rect)
 
@@ -907,216 +1022,189 @@ def game_win(message):
     save_game()  # 保存游戏进度
 
 # 提示功能
-def show_hint():
-    global hint_sequence, hint_calculating
+# full_solve 为 True 时搜索清空整个棋盘的完整路线，并判断当前局面能否通关
+def show_hint(full_solve=False):
+    global hint_sequence, hint_calculating, hint_message, hint_route, hint_job_id, hint_parts_expected
     with hint_lock:
         if hint_calculating:
             return  # 已经在计算中，避免重复计算
         hint_sequence = []
+        hint_message = ''
+        hint_route = False
+        if len(stack) > MAX_STACK_SIZE:
+            # 栈已溢出的局面（例如从游戏失败时的存档继续）无法再走，不做搜索
+            hint_message = "栈已满，无法提示"
+            return
+    print("Calculating hint...")
+    if not full_solve:
+        # 首先使用贪心算法寻找直接可消除的三个图案，只需检查可点击的图案，直接在主线程完成
+        greedy_hint = find_greedy_hint()
+        if greedy_hint:
+            with hint_lock:
+                hint_sequence = greedy_hint
+            return
+    # 如果找不到，交给后台计算；在主线程中生成局面快照，后台只读取快照
+    root_state = build_solver_state()
+    solver_board, solver_state = root_state
+    root_split = []
+    if HINT_BACKEND == 'process' and HINT_WORKERS > 1 and not full_solve:
+        root_split = solver.split_root_moves(solver_board, solver_state, HINT_WORKERS)
+    with hint_lock:
+        hint_job_id += 1
+        job_id = hint_job_id
         hint_calculating = True
-    threading.Thread(target=calculate_hint).start()
+        hint_parts.clear()
+        hint_parts_expected = max(1, len(root_split))
+    if HINT_BACKEND == 'process':
+        hint_job_value.value = job_id
+        pool = get_hint_process_pool()
+        if root_split:
+            # 先更新任务编号再重置：旧任务的进程在锁内确认自己未被取消后才会改写此值
+            hint_best_value.value = MAX_STACK_SIZE + 1
+            futures = [pool.submit(solver.process_root_split_job, job_id, hint_table.generation,
+                                   solver_board, solver_state, root_cells)
+                       for root_cells in root_split]
+        else:
+            futures = [pool.submit(solver.process_hint_job, job_id, hint_table.generation,
+                                   solver_board, solver_state, full_solve)]
+        for future in futures:
+            future.add_done_callback(lambda done: hint_results.put((job_id, full_solve, done)))
+    else:
+        threading.Thread(target=calculate_hint, args=(job_id, root_state, full_solve), daemon=True).start()
 
-def calculate_hint():
-    global hint_sequence, hint_calculating
-    hint_sequence = []
-    print("Calculating hint...")
-    # 首先使用贪心算法寻找直接可消除的三个图案
-    hint_sequence = find_greedy_hint()
-    if not hint_sequence:
-        # 如果找不到，使用 DFS 算法计算提示
-        root_state = (stack.copy(), copy_board_layers(board_layers))
-        hint_sequence = find_hint_sequence(root_state)
+# 线程后端：在提示线程中计算，结果放入 hint_results 队列
+# 出错时放入 None，主循环据此结束"计算中"状态
+def calculate_hint(job_id, root_state, full_solve=False):
+    result = None
+    try:
+        with hint_table_lock:
+            if hint_job_id == job_id:  # 等锁期间可能已被取消
+                result = find_hint_sequence(root_state, full_solve, should_stop=lambda: hint_job_id != job_id)
+    except Exception as e:
+        print(f"提示计算出错: {e}")
+    hint_results.put((job_id, full_solve, result))
+
+# 清空置换表，先等待仍在运行的提示线程停止（取消后最多再搜索 TIME_CHECK_INTERVAL 个节点）
+def clear_hint_table():
+    with hint_table_lock:
+        hint_table.clear()
+
+# 进程后端的进程池，第一次使用时创建
+def get_hint_process_pool():
+    global hint_process_pool
+    if hint_process_pool is None:
+        hint_process_pool = ProcessPoolExecutor(max_workers=max(1, HINT_WORKERS),
+                                                initializer=solver.init_hint_worker,
+                                                initargs=(hint_job_value, hint_best_value))
+    return hint_process_pool
+
+# 取消正在进行的提示计算，玩家点击图案或撤销时调用
+def cancel_hint():
+    global hint_calculating, hint_job_id
     with hint_lock:
+        if not hint_calculating:
+            return
+        hint_job_id += 1  # 旧任务的编号不再匹配，线程和工作进程都会停止
         hint_calculating = False
-    if hint_sequence:
-        print("Hint sequence generated:")
-        for tile in hint_sequence:
-            print(f"Number: {tile['number']}")
-    else:
-        print("无法找到可行的提示序列")
+    hint_job_value.value = hint_job_id
+
+# 由主循环每帧调用，不阻塞地取出已完成的提示结果
+def poll_hint_results():
+    global hint_sequence, hint_calculating, hint_message, hint_route
+    while True:
+        try:
+            job_id, full_solve, result = hint_results.get_nowait()
+        except queue.Empty:
+            return
+        if result is not None and not isinstance(result, dict):
+            # 进程后端返回的是 Future
+            if result.cancelled():
+                result = None
+            else:
+                try:
+                    result = result.result()
+                except Exception as e:
+                    print(f"提示计算出错: {e}")
+                    result = None
+        with hint_lock:
+            if job_id != hint_job_id:
+                continue  # 已取消或已过期的结果
+            # 出错的部分记为 None，同样计入已返回的数量，全部返回后才合并一次
+            hint_parts.append(result)
+            if len(hint_parts) < hint_parts_expected:
+                continue  # 并行搜索还有进程未返回
+            hint_calculating = False
+            result = merge_hint_results([part for part in hint_parts if part is not None])
+            if result is None:
+                continue
+            print(f"提示搜索：{result['status']} {result['reason']}，{result['nodes']} 个节点，"
+                  f"用时 {result['seconds']:.3f} 秒，置换表：{result['table']}")
+            hint_sequence = cells_to_tiles(result['cells'])
+            if full_solve:
+                if result['status'] == solver.SOLVE_SOLVED:
+                    hint_route = True  # 剩余步数由 current_hint_message 按剩余路线计算
+                elif result['status'] == solver.SOLVE_LOST:
+                    hint_message = "当前局面已无法通关"
+                else:
+                    hint_message = "未能判断能否通关"
+        if hint_sequence:
+            print("Hint sequence generated:")
+            for tile in hint_sequence:
+                print(f"Number: {tile.number}")
+        else:
+            print("无法找到可行的提示序列")
 
+# 贪心提示：栈中已有的同种图案也算在内，选择点击次数最少且不会使栈溢出的消除
+# 与 engine 的贪心策略使用同一实现
 def find_greedy_hint():
-    available_tiles = get_all_uncovered_tiles(board_layers)
-    if not available_tiles:
-        return []
-    # 统计可点击图案中每种图案的数量
-    tile_counts = {}
-    for tile in available_tiles:
-        tile_counts[tile['number']] = tile_counts.get(tile['number'], 0) + 1
-
-    # 查找数量达到 3 的图案
-    for number, count in tile_counts.items():
-        if count >= 3:
-            matching_tiles = [tile for tile in available_tiles if tile['number'] == number]
-            return matching_tiles[:3]  # 返回可以直接消除的三个图案
-
-    return []
-
-def find_hint_sequence(root_state):
-    max_depth = MAX_STACK_SIZE - len(stack)
-    time_limit = 1.0  # 秒
-    start_time = time.time()
-    _, board_layers_param = root_state
-    available_tiles = get_all_uncovered_tiles(board_layers_param)
-    if not available_tiles or max_depth <= 0:
-        return []
-
-    # 启发式排序
-    tile_counts = {}
-    for tile in available_tiles:
-        tile_counts[tile['number']] = tile_counts.get(tile['number'], 0) + 1
-
-    unmatched_numbers_in_stack = [tile['number'] for tile in stack]
-    def tile_priority(tile):
-        priority = 0
-        if tile['number'] in unmatched_numbers_in_stack:
-            priority += 100
-        priority += tile_counts[tile['number']]
-        return -priority  # 负号使得数值越大优先级越高
-
-    available_tiles.sort(key=tile_priority)
-
-    # 迭代加深搜索
-    for depth in range(1, max_depth + 1):
-        visited_states = set()
-        success, result = dfs_search(root_state, [], depth, start_time, time_limit, visited_states, root_state)
-        if success:
-            return result
-    return []
-
-def dfs_search(state, path, max_depth, start_time, time_limit, visited_states, root_state):
-    # 检查时间限制
-    if time.time() - start_time > time_limit:
-        return False, []
-    # 检查深度限制
-    if len(path) >= max_depth:
-        return False, []
-    stack_param, board_layers_param = state
-    # 检查是否发生了消除
-    if len(stack_param) < len(root_state[0]):
-        return True, path
-    # 序列化状态
-    state_key = serialize_state(state)
-    if state_key in visited_states:
-        return False, []
-    visited_states.add(state_key)
-    if len(stack_param) >= MAX_STACK_SIZE:
-        return False, []
-    # 获取可点击的图案
-    available_tiles = get_all_uncovered_tiles(board_layers_param)
-    if not available_tiles:
-        return False, []
-    for tile in available_tiles:
-        new_path = path + [tile]
-        new_stack = stack_param.copy()
-        new_board_layers = copy_board_layers(board_layers_param)
-        new_stack.append(tile)
-        remove_tile_in_layers(new_board_layers, tile)
-        if len(new_stack) > MAX_STACK_SIZE:
-            continue  # 栈溢出，剪枝
-        new_stack, eliminated = simulate_check_match_in_stack(new_stack)
-        new_state = (new_stack, new_board_layers)
-        success, result = dfs_search(new_state, new_path, max_depth, start_time, time_limit, visited_states, root_state)
-        if success:
-            return True, result
-    return False, []
-
-def simulate_check_match_in_stack(stack_param):
-    new_stack = stack_param.copy()
-    eliminated = False
-    changed = True
-    while changed and len(new_stack) >= 3:
-        changed = False
-        counts = {}
-        for tile in new_stack:
-            counts[tile['number']] = counts.get(tile['number'], 0) + 1
-        for number, count in counts.items():
-            if count >= 3:
-                # 找到三个相同的图案，移除它们
-                remove_indices = [i for i, tile in enumerate(new_stack) if tile['number'] == number][-3:]
-                for index in sorted(remove_indices, reverse=True):
-                    del new_stack[index]
-                eliminated = True
-                changed = True
-                break  # 重新检查
-    return new_stack, eliminated
-
-def get_all_uncovered_tiles(board_layers_param):
-    tiles = []
-    for layer in board_layers_param:
-        for row in layer:
-            for tile in row:
-                if tile and is_tile_uncovered(tile):
-                    tiles.append(tile)
+    return [board_tiles[cell] for cell in game_state.greedy_cells()]
+
+# 把当前局面转换为求解器使用的紧凑局面
+def build_solver_state():
+    return game_state.solver_state()
+
+# 合并并行搜索各进程的结果：取最短的提示序列，节点数相加
+def merge_hint_results(parts):
+    if not parts:
+        return None
+    found = [part for part in parts if part['cells']]
+    merged = dict(min(found, key=lambda part: len(part['cells'])) if found else parts[0])
+    merged['nodes'] = sum(part['nodes'] for part in parts)
+    merged['seconds'] = max(part['seconds'] for part in parts)
+    return merged
+
+# 在当前线程中搜索提示，返回求解器的结果字典（cells 为格子序列）
+def find_hint_sequence(root_state, full_solve=False, should_stop=None):
+    solver_board, solver_state = root_state
+    return solver.run_hint_job(solver_board, solver_state, full_solve, hint_table, should_stop)
+
+def cells_to_tiles(cells):
+    tiles = [board_tiles[cell] for cell in cells]
+    if None in tiles:
+        return []  # 计算期间棋盘已经变化
     return tiles
 
-def copy_board_layers(board_layers_original):
-    # 创建一个新的棋盘层数据，保持对原始图案对象的引用
-    new_board_layers = []
-    for layer in board_layers_original:
-        new_layer = []
-        for row in layer:
-            new_row = row.copy()  # 浅拷贝行
-            new_layer.append(new_row)
-        new_board_layers.append(new_layer)
-    return new_board_layers
-
-def serialize_state(state):
-    stack_param, board_layers_param = state
-    stack_state = tuple(sorted([tile['number'] for tile in stack_param]))
-    # 对于 board_layers，只需要序列化图案的存在性和编号
-    board_state = tuple(
-        tuple(
-            tuple(tile['number'] if tile else None for tile in row)
-            for row in layer
-        )
-        for layer in board_layers_param
-    )
-    return (stack_state, board_state)
-
-def remove_tile_in_layers(board_layers_param, tile_to_remove):
-    for layer in board_layers_param:
-        for row in layer:
-            for idx, tile in enumerate(row):
-                if tile and tile['number'] == tile_to_remove['number'] and tile == tile_to_remove:
-                    row[idx] = None  # 不修改 tile 对象
-                    return
+# 当前棋盘上未被遮挡的图案，直接使用局面增量维护的可拿取集合
+def get_all_uncovered_tiles():
+    return [board_tiles[cell] for cell in game_state.free_cells()]
 
 # 撤销功能
 def undo_move():
-    global hint_sequence
+    global hint_sequence, hint_message, hint_route
     if not stack:
         return  # 栈为空，无法撤销
-    tile = stack.pop()
-    pos = tile.get('original_position', None)
-    if pos:
-        # 将图案放回原来的位置
-        layer = pos['layer']
-        row = pos['row']
-        col = pos['col']
-        if board_layers[layer][row][col] is None:
-            board_layers[layer][row][col] = tile
-            # 重新计算 tile 的 rect
-            offset = layer_offsets[layer]
-            rand_offset_x = random.randint(-TILE_SIZE // 8, TILE_SIZE // 8)
-            rand_offset_y = random.randint(-TILE_SIZE // 8, TILE_SIZE // 8)
-            tile['rect'] = pygame.Rect(
-                col * TILE_SIZE + offset['x'] + rand_offset_x + 150,  # 右移，避免遮挡角色
-                row * TILE_SIZE + offset['y'] + rand_offset_y,
-                TILE_SIZE,
-                TILE_SIZE
-            )
-            tile['layer'] = layer
-            # 清除 tile 的原始位置
-            tile['original_position'] = None
-        else:
-            print("无法撤销，此位置已被占用。")
+    cancel_hint()
+    # 将栈顶的图案放回原来的位置，局面同时恢复遮挡关系
+    if game_state.undo():
+        sync_tile_views()
     else:
         print("无法撤销此图案，没有原始位置记录")
 
     # 撤销操作后，清空提示序列
     with hint_lock:
         hint_sequence = []
+        hint_message = ''
+        hint_route = False
     save_game()  # 保存游戏进度
 
 # 绘制主菜单界面
@@ -1125,7 +1213,7 @@ def draw_main_menu():
     screen.blit(menu_background, (0, 0))
 
     # 绘制标题
-    title_text = title_font.render("投喂精灵小游戏", True, BLACK)
+    title_text = render_text(title_font, "投喂精灵小游戏", BLACK)
     screen.blit(title_text, (WIDTH / 2 - title_text.get_width() / 2, HEIGHT / 2 - 300))
 
     # 绘制按钮
@@ -1135,7 +1223,7 @@ def draw_main_menu():
     # 绘制按钮文字
     buttons_text = ["开始游戏", "继续游戏", "排行榜", "退出游戏"]
     for i, button in enumerate([start_game_button, continue_game_button, leaderboard_button, quit_game_button]):
-        text = font.render(buttons_text[i], True, BUTTON_TEXT_COLOR)
+        text = render_text(font, buttons_text[i], BUTTON_TEXT_COLOR)
         screen.blit(text, (button.centerx - text.get_width() / 2,
                            button.centery - text.get_height() / 2))
 
@@ -1145,11 +1233,13 @@ def handle_main_menu_click(pos):
     if start_game_button.collidepoint(pos):
         current_state = STATE_CHARACTER_SELECTION
     elif continue_game_button.collidepoint(pos):
+        save_store.refresh()  # 存档文件被外部修改时重新加载
         if load_game():
             current_state = STATE_CONTINUE_GAME_SELECTION  # 进入选择继续游戏的界面
         else:
             show_no_continue_game_message()
     elif leaderboard_button.collidepoint(pos):
+        save_store.refresh()  # 存档文件被外部修改时重新加载
         current_state = STATE_LEADERBOARD
     elif quit_game_button.collidepoint(pos):
         pygame.quit()
@@ -1159,7 +1249,7 @@ def handle_main_menu_click(pos):
 def show_no_continue_game_message():
     screen.fill(BG_COLOR)
     message = "暂无可继续的游戏，请先开始新游戏。"
-    message_text = font.render(message, True, BLACK)
+    message_text = render_text(font, message, BLACK)
     rect = message_text.get_rect(center=(WIDTH / 2, HEIGHT / 2))
     screen.blit(message_text, rect)
     pygame.display.flip()
@@ -1168,117 +1258,113 @@ def show_no_continue_game_message():
     global current_state
     current_state = STATE_MAIN_MENU
 
-# 绘制排行榜界面
-def draw_leaderboard():
-    screen.blit(menu_background, (0, 0))
-    title_text = title_font.render("排行榜", True, BLACK)
-    screen.blit(title_text, (WIDTH / 2 - title_text.get_width() / 2, 50))
-    
-    # 加载所有保存的游戏
-    if os.path.exists(SAVEGAME_FILE):
-        try:
-            with open(SAVEGAME_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                saved_games = data.get('saved_games', [])
-                if not saved_games:
-                    raise ValueError("没有可显示的排行榜数据。")
-                # 按分数从高到低排序
-                sorted_leaderboard = sorted(saved_games, key=lambda x: x['score'], reverse=True)
-                # 仅显示前10名
-                for idx, game in enumerate(sorted_leaderboard[:10]):
-                    name = game.get('player_name', '未知')
-                    score_val = game.get('score', 0)
-                    level_val = game.get('level', 1)
-                    entry_text = font.render(f"{idx + 1}. {name} - 分数: {score_val} - 关卡: {level_val}", True, BLACK)
-                    entry_rect = pygame.Rect(WIDTH / 2 - 200, 150 + idx * 40, 400, 30)
-                    pygame.draw.rect(screen, BUTTON_COLOR, entry_rect, border_radius=5)
-                    screen.blit(entry_text, (entry_rect.centerx - entry_text.get_width() / 2,
-                                             entry_rect.centery - entry_text.get_height() / 2))
-        except (json.JSONDecodeError, KeyError, ValueError):
-            message = "暂无可显示的排行榜数据。"
-            message_text = font.render(message, True, BLACK)
-            rect = message_text.get_rect(center=(WIDTH / 2, HEIGHT / 2))
-            screen.blit(message_text, rect)
+# 存档列表界面最多显示的条目数
+SAVED_GAMES_SHOWN = 10
+# 已排序的存档索引，随存档管理器的版本号失效
+saved_games_cache = {'version': None, 'games': []}
+# 排行榜和继续游戏界面的整屏缓存：界面名 -> (存档版本, surface)
+saved_games_screen_cache = {}
+
+# 获取按分数从高到低排序的存档列表，存档未变化时直接返回缓存
+def saved_games_index():
+    version = save_store.version
+    if saved_games_cache['version'] != version:
+        saved_games_cache['games'] = save_store.saved_games()[:SAVED_GAMES_SHOWN]
+        saved_games_cache['version'] = version
+    return saved_games_cache['games']
+
+# 继续游戏界面中第 idx 个存档的按钮区域
+def continue_game_entry_rect(idx):
+    return pygame.Rect(WIDTH / 2 - 200, 150 + idx * 60, 400, 50)
+
+# 绘制排行榜界面的全部内容
+def render_leaderboard_screen():
+    surface = pygame.Surface((WIDTH, HEIGHT)).convert()
+    surface.blit(menu_background, (0, 0))
+    title_text = render_text(title_font, "排行榜", BLACK)
+    surface.blit(title_text, (WIDTH / 2 - title_text.get_width() / 2, 50))
+
+    saved_games = saved_games_index()
+    if saved_games:
+        for idx, game in enumerate(saved_games):
+            name = game.get('player_name', '未知')
+            score_val = game.get('score', 0)
+            level_val = game.get('level', 1)
+            entry_text = render_text(font, f"{idx + 1}. {name} - 分数: {score_val} - 关卡: {level_val}", BLACK)
+            entry_rect = pygame.Rect(WIDTH / 2 - 200, 150 + idx * 40, 400, 30)
+            pygame.draw.rect(surface, BUTTON_COLOR, entry_rect, border_radius=5)
+            surface.blit(entry_text, (entry_rect.centerx - entry_text.get_width() / 2,
+                                      entry_rect.centery - entry_text.get_height() / 2))
     else:
-        message = "暂无可显示的排行榜数据。"
-        message_text = font.render(message, True, BLACK)
+        message_text = render_text(font, "暂无可显示的排行榜数据。", BLACK)
         rect = message_text.get_rect(center=(WIDTH / 2, HEIGHT / 2))
-        screen.blit(message_text, rect)
-    
-    # 显示返回提示
-    return_text = font.render("按 ESC 返回主菜单", True, BLACK)
-    screen.blit(return_text, (WIDTH / 2 - return_text.get_width() / 2, HEIGHT - 100))
+        surface.blit(message_text, rect)
 
-# 继续游戏界面绘制
-def draw_continue_game_selection():
-    screen.blit(menu_background, (0, 0))
+    # 显示返回提示
+    return_text = render_text(font, "按 ESC 返回主菜单", BLACK)
+    surface.blit(return_text, (WIDTH / 2 - return_text.get_width() / 2, HEIGHT - 100))
+    return surface
+
+# 绘制继续游戏界面的全部内容
+def render_continue_game_screen():
+    surface = pygame.Surface((WIDTH, HEIGHT)).convert()
+    surface.blit(menu_background, (0, 0))
     # 绘制标题
-    title_text = big_font.render("选择要继续的游戏", True, BLACK)
-    screen.blit(title_text, (WIDTH / 2 - title_text.get_width() / 2, 50))
-
-    # 加载所有保存的游戏
-    if os.path.exists(SAVEGAME_FILE):
-        try:
-            with open(SAVEGAME_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                saved_games = data.get('saved_games', [])
-                if not saved_games:
-                    raise ValueError("没有可继续的游戏。")
-                # 按分数从高到低排序
-                sorted_saved_games = sorted(saved_games, key=lambda x: x['score'], reverse=True)
-                # 显示每个保存的游戏
-                for idx, game in enumerate(sorted_saved_games[:10]):
-                    name = game.get('player_name', '未知')
-                    score_val = game.get('score', 0)
-                    level_val = game.get('level', 1)
-                    selected_char = game.get('selected_character', 0)
-                    entry_text = font.render(f"{idx + 1}. {name} - 分数: {score_val} - 关卡: {level_val}", True, BLACK)
-                    entry_rect = pygame.Rect(WIDTH / 2 - 200, 150 + idx * 60, 400, 50)
-                    pygame.draw.rect(screen, BUTTON_COLOR, entry_rect, border_radius=10)
-                    screen.blit(entry_text, (entry_rect.centerx - entry_text.get_width() / 2,
-                                             entry_rect.centery - entry_text.get_height() / 2))
-            # 显示返回提示
-            return_text = font.render("按 ESC 返回主菜单", True, BLACK)
-            screen.blit(return_text, (WIDTH / 2 - return_text.get_width() / 2, HEIGHT - 100))
-        except (json.JSONDecodeError, KeyError, ValueError):
-            message = "暂无可继续的游戏，请先开始新游戏。"
-            message_text = font.render(message, True, BLACK)
-            rect = message_text.get_rect(center=(WIDTH / 2, HEIGHT / 2))
-            screen.blit(message_text, rect)
+    title_text = render_text(big_font, "选择要继续的游戏", BLACK)
+    surface.blit(title_text, (WIDTH / 2 - title_text.get_width() / 2, 50))
+
+    saved_games = saved_games_index()
+    if saved_games:
+        # 显示每个保存的游戏
+        for idx, game in enumerate(saved_games):
+            name = game.get('player_name', '未知')
+            score_val = game.get('score', 0)
+            level_val = game.get('level', 1)
+            entry_text = render_text(font, f"{idx + 1}. {name} - 分数: {score_val} - 关卡: {level_val}", BLACK)
+            entry_rect = continue_game_entry_rect(idx)
+            pygame.draw.rect(surface, BUTTON_COLOR, entry_rect, border_radius=10)
+            surface.blit(entry_text, (entry_rect.centerx - entry_text.get_width() / 2,
+                                      entry_rect.centery - entry_text.get_height() / 2))
+        # 显示返回提示
+        return_text = render_text(font, "按 ESC 返回主菜单", BLACK)
+        surface.blit(return_text, (WIDTH / 2 - return_text.get_width() / 2, HEIGHT - 100))
     else:
-        message = "暂无可继续的游戏，请先开始新游戏。"
-        message_text = font.render(message, True, BLACK)
+        message_text = render_text(font, "暂无可继续的游戏，请先开始新游戏。", BLACK)
         rect = message_text.get_rect(center=(WIDTH / 2, HEIGHT / 2))
-        screen.blit(message_text, rect)
+        surface.blit(message_text, rect)
+    return surface
+
+# 获取存档列表界面的缓存画面，存档变化后重新绘制
+def saved_games_screen(name, render):
+    version = save_store.version
+    cached = saved_games_screen_cache.get(name)
+    if cached is None or cached[0] != version:
+        cached = (version, render())
+        saved_games_screen_cache[name] = cached
+    return cached[1]
 
-    pygame.display.flip()
+# 绘制排行榜界面
+def draw_leaderboard():
+    screen.blit(saved_games_screen('leaderboard', render_leaderboard_screen), (0, 0))
+
+# 继续游戏界面绘制
+def draw_continue_game_selection():
+    screen.blit(saved_games_screen('continue', render_continue_game_screen), (0, 0))
 
 # 处理继续游戏选择点击
 def handle_continue_game_selection_click(pos):
     global current_state
-    if os.path.exists(SAVEGAME_FILE):
-        try:
-            with open(SAVEGAME_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                saved_games = data.get('saved_games', [])
-                if not saved_games:
-                    show_no_continue_game_message()
-                    return
-                # 按分数从高到低排序
-                sorted_saved_games = sorted(saved_games, key=lambda x: x['score'], reverse=True)
-                # 每个保存的游戏占用一个区域，假设每个区域高度为60，起始y为150
-                for idx, game in enumerate(sorted_saved_games[:10]):
-                    entry_rect = pygame.Rect(WIDTH / 2 - 200, 150 + idx * 60, 400, 50)
-                    if entry_rect.collidepoint(pos):
-                        if load_specific_game(idx):
-                            current_state = STATE_GAME
-                        else:
-                            show_no_continue_game_message()
-                        return
-        except (json.JSONDecodeError, KeyError, ValueError):
-            show_no_continue_game_message()
-    else:
+    saved_games = saved_games_index()
+    if not saved_games:
         show_no_continue_game_message()
+        return
+    for idx in range(len(saved_games)):
+        if continue_game_entry_rect(idx).collidepoint(pos):
+            if load_specific_game(idx):
+                current_state = STATE_GAME
+            else:
+                show_no_continue_game_message()
+            return
 
 # 主游戏循环
 def main_loop():
@@ -1290,75 +1376,93 @@ def main_loop():
 
     running = True
     while running:
-        clock.tick(FPS)
+        # 上一帧结束时的状态随帧耗时写入追踪文件，用于区分卡顿来自提示计算还是后台写盘
+        frame_profiler.begin_frame({'state': current_state, 'hint': hint_calculating,
+                                    'writes': save_store.write_count})
+        with frame_profiler.section('wait'):
+            clock.tick(FPS)
 
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-            elif event.type == pygame.MOUSEBUTTONDOWN:
-                pos = event.pos
-                if current_state == STATE_MAIN_MENU:
-                    handle_main_menu_click(pos)
-                elif current_state == STATE_LEADERBOARD:
-                    pass  # 目前无交互
-                elif current_state == STATE_CONTINUE_GAME_SELECTION:
-                    handle_continue_game_selection_click(pos)
-                elif current_state == STATE_CHARACTER_SELECTION:
-                    select_character()  # 直接调用角色选择函数
-                    # 角色选择完成后，进入名字输入界面
-                    current_state = STATE_NAME_INPUT
-                elif current_state == STATE_NAME_INPUT:
-                    pass  # 处理名字输入已集成到状态转换
-                elif current_state == STATE_GAME:
-                    if hint_button_rect.collidepoint(pos):
-                        show_hint()
-                    elif undo_button_rect.collidepoint(pos):
-                        undo_move()
-                    else:
-                        handle_click(pos)
-            elif event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
-                    if current_state in [STATE_LEADERBOARD, STATE_CONTINUE_GAME_SELECTION, STATE_CHARACTER_SELECTION, STATE_NAME_INPUT]:
-                        current_state = STATE_MAIN_MENU
+        with frame_profiler.section('input'):
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    running = False
+                elif event.type == pygame.MOUSEBUTTONDOWN:
+                    pos = event.pos
+                    if current_state == STATE_MAIN_MENU:
+                        handle_main_menu_click(pos)
+                    elif current_state == STATE_LEADERBOARD:
+                        pass  # 目前无交互
+                    elif current_state == STATE_CONTINUE_GAME_SELECTION:
+                        handle_continue_game_selection_click(pos)
+                    elif current_state == STATE_CHARACTER_SELECTION:
+                        select_character()  # 直接调用角色选择函数
+                        # 角色选择完成后，进入名字输入界面
+                        current_state = STATE_NAME_INPUT
+                    elif current_state == STATE_NAME_INPUT:
+                        pass  # 处理名字输入已集成到状态转换
                     elif current_state == STATE_GAME:
-                        # 确认退出游戏
-                        confirm_quit_game()
+                        if hint_button_rect.collidepoint(pos):
+                            # 左键提示下一次消除，右键求解整关路线
+                            show_hint(full_solve=event.button == 3)
+                        elif undo_button_rect.collidepoint(pos):
+                            undo_move()
+                        else:
+                            handle_click(pos)
+                elif event.type == pygame.KEYDOWN:
+                    if event.key == PROFILER_OVERLAY_KEY:
+                        toggle_profiler_overlay()
+                    elif event.key == pygame.K_ESCAPE:
+                        if current_state in [STATE_LEADERBOARD, STATE_CONTINUE_GAME_SELECTION, STATE_CHARACTER_SELECTION, STATE_NAME_INPUT]:
+                            current_state = STATE_MAIN_MENU
+                        elif current_state == STATE_GAME:
+                            # 确认退出游戏
+                            confirm_quit_game()
 
         # 更新角色状态计时器
         if current_state == STATE_GAME:
-            if character_state == 'happy':
-                character_reaction_time -= 1
-                if character_reaction_time <= 0:
-                    character_state = 'normal'
+            with frame_profiler.section('update'):
+                poll_hint_results()
+                if character_state == 'happy':
+                    character_reaction_time -= 1
+                    if character_reaction_time <= 0:
+                        character_state = 'normal'
             # 限制保存频率
             current_time = time.time()
             if current_time - last_save_time > SAVE_INTERVAL:
-                save_game()
+                with frame_profiler.section('save'):
+                    save_game()
                 last_save_time = current_time
 
         # 根据当前状态绘制相应界面
-        if current_state == STATE_MAIN_MENU:
-            draw_main_menu()
-        elif current_state == STATE_GAME:
-            draw_game_elements()
-            handle_animations()
-        elif current_state == STATE_LEADERBOARD:
-            draw_leaderboard()
-        elif current_state == STATE_CONTINUE_GAME_SELECTION:
-            draw_continue_game_selection()
-        elif current_state == STATE_CHARACTER_SELECTION:
-            pass  # 已在选择点击中处理
-        elif current_state == STATE_NAME_INPUT:
-            input_character_name()
-            # 启动新游戏后，进入游戏状态
-            start_new_game(player_name)
-        elif current_state == STATE_GAME_OVER:
-            pass  # 已在 game_over 函数中处理
-        elif current_state == STATE_GAME_WIN:
-            pass  # 已在 game_win 函数中处理
-
-        pygame.display.flip()
-
+        with frame_profiler.section('draw'):
+            if current_state != STATE_GAME:
+                invalidate_game_screen()  # 回到游戏界面时需要整屏重绘
+            if current_state == STATE_MAIN_MENU:
+                draw_main_menu()
+            elif current_state == STATE_GAME:
+                render_game()  # 游戏界面自行推送变化的区域
+            elif current_state == STATE_LEADERBOARD:
+                draw_leaderboard()
+            elif current_state == STATE_CONTINUE_GAME_SELECTION:
+                draw_continue_game_selection()
+            elif current_state == STATE_CHARACTER_SELECTION:
+                pass  # 已在选择点击中处理
+            elif current_state == STATE_NAME_INPUT:
+                input_character_name()
+                # 启动新游戏后，进入游戏状态
+                start_new_game(player_name)
+            elif current_state == STATE_GAME_OVER:
+                pass  # 已在 game_over 函数中处理
+            elif current_state == STATE_GAME_WIN:
+                pass  # 已在 game_win 函数中处理
+
+            if current_state != STATE_GAME:
+                update_profiler_overlay()
+                draw_profiler_overlay()
+                with frame_profiler.section('flip'):
+                    pygame.display.flip()
+
+    frame_profiler.close()
     pygame.quit()
 
 # 确认退出游戏
@@ -1373,16 +1477,16 @@ def confirm_quit_game():
         screen.blit(menu_background, (0, 0))
         
         pygame.draw.rect(screen, BUTTON_COLOR, confirm_box, border_radius=10)
-        confirm_text = font.render("确定退出游戏吗？", True, BLACK)
+        confirm_text = render_text(font, "确定退出游戏吗？", BLACK)
         screen.blit(confirm_text, (confirm_box.centerx - confirm_text.get_width() / 2,
                                    confirm_box.centery - confirm_text.get_height() / 2 - 30))
         pygame.draw.rect(screen, (34, 139, 34), yes_button, border_radius=5)  # Forest Green
         pygame.draw.rect(screen, (178, 34, 34), no_button, border_radius=5)   # Firebrick
         pygame.draw.rect(screen, (255, 215, 0), save_button, border_radius=5) # Gold for save
         
-        yes_text = font.render("是", True, WHITE)
-        no_text = font.render("否", True, WHITE)
-        save_text = font.render("保存并退出", True, BLACK)
+        yes_text = render_text(font, "是", WHITE)
+        no_text = render_text(font, "否", WHITE)
+        save_text = render_text(font, "保存并退出", BLACK)
         
         screen.blit(yes_text, (yes_button.centerx - yes_text.get_width() / 2,
                                yes_button.centery - yes_text.get_height() / 2))
@@ -1405,6 +1509,7 @@ def confirm_quit_game():
                     sys.exit()
                 elif no_button.collidepoint(pos):
                     selecting = False
+                    invalidate_game_screen()  # 对话框覆盖了游戏画面
                 elif save_button.collidepoint(pos):
                     save_game()
                     pygame.quit()
@@ -1427,5 +1532,7 @@ def prepare_game():
 
 # 主程序入口
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # 打包后使用进程池提示时需要，必须在创建窗口之前
+    init_display()
     prepare_game()
     main_loop()
@@ -0,0 +1,116 @@
+"""帧耗时统计：按阶段（输入、更新、保存、绘制、刷新、等待）记录每一帧的耗时
+
+保留最近若干帧，计算滚动的 p50、p95、p99 和帧时间分布；可选地把每一帧写入 JSONL 追踪文件。
+"""
+
+import contextlib
+import json
+import time
+from collections import deque
+
+WINDOW_FRAMES = 300  # 滚动统计保留的帧数（60 FPS 下约 5 秒）
+SECTIONS = ('input', 'update', 'save', 'draw', 'flip', 'wait')
+# 帧时间分布的区间上限（毫秒），最后一个区间为超过最大上限的帧
+HISTOGRAM_BOUNDS = (8.0, 16.7, 20.0, 33.3, 50.0, 100.0)
+TRACE_FLUSH_FRAMES = 60  # 追踪文件每隔多少帧刷新一次
+
+
+# 已排序样本的百分位数（最近秩法）
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+class FrameProfiler:
+    """记录每一帧各阶段的耗时（毫秒）
+
+    阶段可以嵌套，嵌套的阶段计入内层，不重复计入外层，因此各阶段之和不超过帧时间。
+    帧时间为相邻两次 begin_frame 之间的间隔，包含等待下一帧的时间。
+    """
+
+    def __init__(self, window=WINDOW_FRAMES, trace_path=None):
+        self.window = window
+        self.frame_times = deque(maxlen=window)
+        self.section_times = {name: deque(maxlen=window) for name in SECTIONS}
+        self.frame_count = 0
+        self.frame_start = None
+        self.current = {}
+        self.active = []  # 正在计时的阶段
+        self.mark = 0.0  # 上一次把时间计入阶段的时刻
+        self.trace_file = None
+        if trace_path:
+            try:
+                self.trace_file = open(trace_path, 'a', encoding='utf-8')
+            except OSError as e:
+                print(f"无法打开帧追踪文件: {e}")
+
+    def begin_frame(self, info=None):
+        """结束上一帧并开始新的一帧；info 为随上一帧写入追踪文件的附加信息"""
+        now = time.perf_counter()
+        if self.frame_start is not None:
+            self._finish_frame(now, info)
+        self.frame_start = now
+        self.current = dict.fromkeys(SECTIONS, 0.0)
+
+    def _finish_frame(self, now, info):
+        frame_ms = (now - self.frame_start) * 1000
+        self.frame_count += 1
+        self.frame_times.append(frame_ms)
+        for name in SECTIONS:
+            self.section_times[name].append(self.current[name])
+        if self.trace_file:
+            record = {'frame': self.frame_count, 'time': round(time.time(), 3), 'ms': round(frame_ms, 3)}
+            record.update((name, round(value, 3)) for name, value in self.current.items())
+            if info:
+                record.update(info)
+            try:
+                self.trace_file.write(json.dumps(record, ensure_ascii=False) + '\n')
+                if self.frame_count % TRACE_FLUSH_FRAMES == 0:
+                    self.trace_file.flush()
+            except OSError as e:
+                print(f"写入帧追踪文件失败: {e}")
+                self.close()
+
+    def _charge(self, now):
+        if self.active:
+            name = self.active[-1]
+            self.current[name] = self.current.get(name, 0.0) + (now - self.mark) * 1000
+        self.mark = now
+
+    @contextlib.contextmanager
+    def section(self, name):
+        """在 with 块中计时一个阶段"""
+        self._charge(time.perf_counter())
+        self.active.append(name)
+        try:
+            yield
+        finally:
+            self._charge(time.perf_counter())
+            self.active.pop()
+
+    def percentiles(self, name=None):
+        """返回最近若干帧的 (p50, p95, p99)，name 为 None 时统计整帧时间"""
+        ordered = sorted(self.frame_times if name is None else self.section_times[name])
+        return percentile(ordered, 0.50), percentile(ordered, 0.95), percentile(ordered, 0.99)
+
+    def histogram(self):
+        """返回最近若干帧的帧时间分布 [(区间上限, 帧数)]，最后一项的上限为 None"""
+        counts = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+        for frame_ms in self.frame_times:
+            for i, bound in enumerate(HISTOGRAM_BOUNDS):
+                if frame_ms <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+        return list(zip(HISTOGRAM_BOUNDS + (None,), counts))
+
+    def close(self):
+        if self.trace_file:
+            try:
+                self.trace_file.close()
+            except OSError:
+                pass
+            self.trace_file = None
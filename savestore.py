@@ -0,0 +1,305 @@
+"""存档管理：在内存中保存已解析的存档，由后台线程合并写入磁盘"""
+
+import atexit
+import base64
+import json
+import os
+import stat
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+MAX_SAVED_GAMES = 10  # 最多保留的存档数
+FLUSH_DELAY = 0.5  # 收到修改后等待多久再写盘（秒），期间的多次修改合并为一次写入
+
+# 存档格式版本：1 为 board_layers 嵌套 JSON 列表，2 为打包压缩后的棋盘
+SAVE_FORMAT_VERSION = 2
+BOARD_MAGIC = b'BRD'
+# 棋盘数据版本：1 只有棋盘，2 在棋盘后记录栈中图案的原始位置，3 再记录每个格子的像素偏移
+BOARD_VERSION = 3
+# 棋盘头部：魔数、棋盘版本、层数、行数、列数
+BOARD_HEADER = struct.Struct('<3sBBBB')
+STACK_COUNT = struct.Struct('<B')
+# 栈中每个图案：原始格子编号、图案编号
+STACK_ENTRY = struct.Struct('<HB')
+NO_CELL = 0xFFFF  # 原始位置未知（由旧存档转换而来）
+JITTER_FLAG = struct.Struct('<B')  # 是否记录了像素偏移
+
+
+# 把棋盘编码为文本：头部 + 每格一个字节的图案编号（0 表示空）+ 栈 + 像素偏移，压缩后转为 base64
+# stack 为 (格子编号, 图案编号) 列表，格子编号按 层-行-列 顺序从 0 开始
+# jitter 为按格子编号排列的 (dx, dy) 列表，每个值在 -128..127 之间
+def encode_board(cells, layers, rows, cols, stack=(), jitter=None):
+    if len(cells) != layers * rows * cols:
+        raise ValueError("棋盘数据长度与尺寸不符")
+    parts = [BOARD_HEADER.pack(BOARD_MAGIC, BOARD_VERSION, layers, rows, cols), bytes(cells),
+             STACK_COUNT.pack(len(stack))]
+    for cell, number in stack:
+        parts.append(STACK_ENTRY.pack(cell, number))
+    if jitter is None:
+        parts.append(JITTER_FLAG.pack(0))
+    else:
+        if len(jitter) != len(cells):
+            raise ValueError("像素偏移数量与格子数不符")
+        parts.append(JITTER_FLAG.pack(1))
+        parts.append(struct.pack(f'<{2 * len(jitter)}b', *(value for pair in jitter for value in pair)))
+    return base64.b64encode(zlib.compress(b''.join(parts), 9)).decode('ascii')
+
+
+# 解码 encode_board 的结果，返回 (层数, 行数, 列数, 每格图案编号, 栈, 像素偏移)
+# 旧版本的数据没有像素偏移，此时像素偏移为 None
+def decode_board(text):
+    try:
+        raw = zlib.decompress(base64.b64decode(text))
+    except (TypeError, ValueError, zlib.error) as e:
+        raise ValueError(f"棋盘数据无法解码: {e}")
+    if len(raw) < BOARD_HEADER.size:
+        raise ValueError("棋盘数据不完整")
+    magic, version, layers, rows, cols = BOARD_HEADER.unpack_from(raw)
+    if magic != BOARD_MAGIC or not 1 <= version <= BOARD_VERSION:
+        raise ValueError("不支持的棋盘数据版本")
+    offset = BOARD_HEADER.size + layers * rows * cols
+    cells = raw[BOARD_HEADER.size:offset]
+    if len(cells) != layers * rows * cols:
+        raise ValueError("棋盘数据长度与尺寸不符")
+    stack = []
+    if version >= 2:
+        try:
+            count, = STACK_COUNT.unpack_from(raw, offset)
+            offset += STACK_COUNT.size
+            for _ in range(count):
+                stack.append(STACK_ENTRY.unpack_from(raw, offset))
+                offset += STACK_ENTRY.size
+        except struct.error:
+            raise ValueError("栈数据不完整")
+    jitter = None
+    if version >= 3:
+        try:
+            has_jitter, = JITTER_FLAG.unpack_from(raw, offset)
+            offset += JITTER_FLAG.size
+            if has_jitter:
+                values = struct.unpack_from(f'<{2 * len(cells)}b', raw, offset)
+                jitter = list(zip(values[0::2], values[1::2]))
+        except struct.error:
+            raise ValueError("像素偏移数据不完整")
+    return layers, rows, cols, cells, stack, jitter
+
+
+# 把旧格式的存档条目（board_layers 为嵌套列表，stack 为图案编号列表）转换为新格式
+def migrate_game(game):
+    if 'stack' not in game and 'board_layers' not in game:
+        return game
+    game = dict(game)
+    jitter = None
+    if 'board' in game:
+        layers, rows, cols, cells, stack, jitter = decode_board(game['board'])
+    else:
+        board_layers = game['board_layers']
+        layers = len(board_layers)
+        rows = len(board_layers[0]) if layers else 0
+        cols = len(board_layers[0][0]) if rows else 0
+        cells = bytes(
+            number or 0
+            for layer in board_layers
+            for row in layer
+            for number in row
+        )
+        stack = []
+    # 旧存档没有记录栈中图案的原始位置
+    stack += [(NO_CELL, number) for number in game.pop('stack', [])]
+    game.pop('board_layers', None)
+    game['board'] = encode_board(cells, layers, rows, cols, stack, jitter)
+    return game
+
+
+class SaveStore:
+    """存档的内存副本，修改后标记为脏，由后台线程原子地写回文件
+
+    saved_games 始终按分数从高到低排序，最多 MAX_SAVED_GAMES 个。
+    """
+
+    def __init__(self, path, max_entries=MAX_SAVED_GAMES, flush_delay=FLUSH_DELAY):
+        self.path = path
+        self.max_entries = max_entries
+        self.flush_delay = flush_delay
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()  # 保证同一时间只有一个线程在写文件
+        self.changed = threading.Condition(self.lock)
+        self.data = None  # 整个存档文件的内容，首次访问时加载
+        self.version = 0  # 每次修改递增
+        self.flushed_version = 0
+        self.last_written = None  # 上一次写入（或读入）的文件内容
+        self.file_mtime = None  # 上一次写入（或读入）时文件的修改时间
+        self.writer = None
+        self.closed = False
+        self.write_count = 0
+        self.skip_count = 0
+
+    def _load_locked(self):
+        if self.data is not None:
+            return
+        data = {}
+        text = None
+        self.file_mtime = self._stat_mtime()
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    text = f.read()
+                data = json.loads(text)
+                if not isinstance(data, dict):
+                    data = {}
+            except (OSError, json.JSONDecodeError, KeyError, TypeError):
+                print("保存的游戏数据有误，无法加载。")
+                data = {}
+        saved_games = data.get('saved_games', [])
+        if not isinstance(saved_games, list):
+            saved_games = []
+        # 旧格式的存档在内存中转换，下次写盘时以新格式保存
+        migrated = []
+        for game in saved_games:
+            try:
+                migrated.append(migrate_game(game))
+            except (KeyError, TypeError, ValueError, IndexError):
+                print("跳过一条无法转换的存档。")
+        data['saved_games'] = sorted(migrated, key=lambda x: x.get('score', 0), reverse=True)
+        data['format'] = SAVE_FORMAT_VERSION
+        self.data = data
+        self.last_written = text
+
+    def _stat_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def refresh(self):
+        """存档文件被外部修改时重新加载，返回是否重新加载
+
+        尚有未落盘的修改时以内存中的存档为准。
+        """
+        with self.lock:
+            if self.data is None or self.version != self.flushed_version:
+                return False
+            if self._stat_mtime() == self.file_mtime:
+                return False
+            self.data = None
+            self._load_locked()
+            self.version += 1
+            self.flushed_version = self.version
+            return True
+
+    def saved_games(self):
+        """返回按分数从高到低排序的存档列表（列表的副本，条目不应被修改）"""
+        with self.lock:
+            self._load_locked()
+            return list(self.data['saved_games'])
+
+    def record(self, game_data):
+        """加入一条存档：未满时追加，已满时替换分数最低且低于本局分数的存档"""
+        with self.lock:
+            self._load_locked()
+            saved_games = self.data['saved_games']
+            if len(saved_games) < self.max_entries:
+                saved_games.append(game_data)
+            else:
+                # 找到最低分
+                min_score = min(saved_games, key=lambda x: x['score'])['score']
+                if game_data['score'] <= min_score:
+                    return
+                # 替换最低分的存档
+                for i, game in enumerate(saved_games):
+                    if game['score'] == min_score:
+                        saved_games[i] = game_data
+                        break
+            # 按分数从高到低排序保存列表
+            saved_games.sort(key=lambda x: x['score'], reverse=True)
+            del saved_games[self.max_entries:]
+            self.version += 1
+            self._start_writer_locked()
+            self.changed.notify()
+
+    def _start_writer_locked(self):
+        if self.writer is None:
+            self.writer = threading.Thread(target=self._writer_loop, name='save-writer', daemon=True)
+            self.writer.start()
+
+    def _writer_loop(self):
+        while True:
+            with self.lock:
+                while self.version == self.flushed_version and not self.closed:
+                    self.changed.wait()
+                if self.closed:
+                    return
+            # 等待一小段时间，把期间的多次修改合并为一次写入
+            time.sleep(self.flush_delay)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"保存游戏失败: {e}")
+
+    def flush(self):
+        """把当前内存中的存档写入磁盘，内容与上次写入相同时跳过"""
+        with self.flush_lock:
+            with self.lock:
+                if self.data is None or self.version == self.flushed_version:
+                    return
+                version = self.version
+                snapshot = dict(self.data)
+                snapshot['saved_games'] = list(self.data['saved_games'])
+            # 存档条目创建后不再修改，可以在锁外序列化
+            text = json.dumps(snapshot, ensure_ascii=False, separators=(',', ':'))
+            if text == self.last_written:
+                self.skip_count += 1
+            else:
+                self._write_atomic(text)
+                self.last_written = text
+                self.write_count += 1
+            with self.lock:
+                self.flushed_version = version
+
+    def _file_mode(self):
+        try:
+            return stat.S_IMODE(os.stat(self.path).st_mode)
+        except OSError:
+            umask = os.umask(0)
+            os.umask(umask)
+            return 0o666 & ~umask
+
+    def _write_atomic(self, text):
+        # 先写临时文件再重命名，避免写到一半时退出导致存档损坏
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(prefix='.savegame-', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(text)
+                f.flush()
+                os.fsync(f.fileno())
+            # mkstemp 创建的文件只有所有者可读写，换成原存档的权限，没有原存档时按 umask 计算
+            os.chmod(temp_path, self._file_mode())
+            os.replace(temp_path, self.path)
+            self.file_mtime = self._stat_mtime()
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def close(self):
+        """退出前同步写入尚未落盘的修改"""
+        try:
+            self.flush()
+        except OSError as e:
+            print(f"保存游戏失败: {e}")
+        with self.lock:
+            self.closed = True
+            self.changed.notify_all()
+
+
+def open_store(path):
+    """创建存档管理器，并在程序退出时自动写入尚未落盘的修改"""
+    store = SaveStore(path)
+    atexit.register(store.close)
+    return store
@@ -0,0 +1,534 @@
+"""提示求解器使用的紧凑局面表示，只依赖标准库，不依赖 pygame"""
+
+import heapq
+import random
+import time
+from collections import OrderedDict
+
+# 棋盘尺寸，需与 game.py 保持一致
+ROWS, COLS = 8, 8
+LAYER_COUNT = 3
+CELL_COUNT = LAYER_COUNT * ROWS * COLS  # 3*8*8 = 192 个格子
+MAX_KINDS = 9  # 图案编号从 1 开始，0 表示空格
+
+# 置换表默认容量（条目数）
+TRANSPOSITION_TABLE_SIZE = 200000
+
+# 每检查多少个节点看一次时间，避免每个节点都调用 time.perf_counter()
+TIME_CHECK_INTERVAL = 256
+
+# 单步提示的时间上限（秒）
+HINT_TIME_LIMIT = 1.0
+
+
+def cell_id(layer, row, col):
+    return (layer * ROWS + row) * COLS + col
+
+
+def cell_coords(cell):
+    layer, rest = divmod(cell, ROWS * COLS)
+    row, col = divmod(rest, COLS)
+    return layer, row, col
+
+
+# Zobrist 随机数表，使用固定种子，保证同一局面在多次提示之间得到相同的哈希值
+_zobrist_rng = random.Random(0x5EED)
+ZOBRIST_CELLS = [_zobrist_rng.getrandbits(64) for _ in range(CELL_COUNT)]
+ZOBRIST_COUNTS = [[_zobrist_rng.getrandbits(64) for _ in range(3)] for _ in range(MAX_KINDS)]
+
+
+def zobrist_hash(present, counts):
+    value = 0
+    remaining = present
+    while remaining:
+        low_bit = remaining & -remaining
+        value ^= ZOBRIST_CELLS[low_bit.bit_length() - 1]
+        remaining ^= low_bit
+    for kind, count in enumerate(counts):
+        value ^= ZOBRIST_COUNTS[kind][count]
+    return value
+
+
+class SolverBoard:
+    """一关棋盘的固定信息：每个格子的图案种类，以及压住它的格子掩码"""
+    __slots__ = ('kinds', 'cover_masks', 'max_stack')
+
+    def __init__(self, kinds, cover_masks, max_stack):
+        self.kinds = kinds  # 长度为 CELL_COUNT 的列表，空格为 0
+        self.cover_masks = cover_masks  # 长度为 CELL_COUNT 的列表，位 i 表示格子 i 压住该格子
+        self.max_stack = max_stack
+
+    def is_free(self, present, cell):
+        return present & self.cover_masks[cell] == 0
+
+    def free_cells(self, present):
+        """返回当前未被遮挡的格子编号，按编号从小到大"""
+        cover_masks = self.cover_masks
+        cells = []
+        remaining = present
+        while remaining:
+            low_bit = remaining & -remaining
+            cell = low_bit.bit_length() - 1
+            remaining ^= low_bit
+            if present & cover_masks[cell] == 0:
+                cells.append(cell)
+        return cells
+
+
+class SolverState:
+    """搜索中的可变局面：棋盘存在位掩码，加上栈中每种图案的数量
+
+    hash 为 Zobrist 哈希，随 pick/unpick 增量更新。
+    """
+    __slots__ = ('present', 'counts', 'stack_size', 'hash')
+
+    def __init__(self, present, counts, stack_size=None, hash_value=None):
+        self.present = present
+        self.counts = list(counts)
+        self.stack_size = sum(self.counts) if stack_size is None else stack_size
+        self.hash = zobrist_hash(present, self.counts) if hash_value is None else hash_value
+
+    def copy(self):
+        return SolverState(self.present, self.counts, self.stack_size, self.hash)
+
+    def pick(self, board, cell):
+        """点击一个格子，返回是否发生了消除，供 unpick 使用"""
+        self.present ^= 1 << cell
+        kind = board.kinds[cell]
+        old_count = self.counts[kind]
+        count = old_count + 1
+        eliminated = count == 3
+        if eliminated:
+            count = 0
+            self.stack_size -= 2
+        else:
+            self.stack_size += 1
+        self.counts[kind] = count
+        kind_keys = ZOBRIST_COUNTS[kind]
+        self.hash ^= ZOBRIST_CELLS[cell] ^ kind_keys[old_count] ^ kind_keys[count]
+        return eliminated
+
+    def unpick(self, board, cell, eliminated):
+        self.present |= 1 << cell
+        kind = board.kinds[cell]
+        count = self.counts[kind]
+        if eliminated:
+            old_count = 2
+            self.stack_size += 2
+        else:
+            old_count = count - 1
+            self.stack_size -= 1
+        self.counts[kind] = old_count
+        kind_keys = ZOBRIST_COUNTS[kind]
+        self.hash ^= ZOBRIST_CELLS[cell] ^ kind_keys[old_count] ^ kind_keys[count]
+
+    def key(self):
+        return self.hash
+
+
+def build_state(board_cells, stack_numbers, cover_cells, max_stack):
+    """由棋盘上的 {cell: 图案编号}、栈中的图案编号和遮挡关系构建求解器局面
+
+    cover_cells 为 {cell: 压住它的 cell 列表}，cell 均为 cell_id() 编号。
+    """
+    kinds = [0] * CELL_COUNT
+    cover_masks = [0] * CELL_COUNT
+    present = 0
+    for cell, number in board_cells.items():
+        kinds[cell] = number
+        present |= 1 << cell
+    for cell, upper_cells in cover_cells.items():
+        mask = 0
+        for upper_cell in upper_cells:
+            mask |= 1 << upper_cell
+        cover_masks[cell] = mask
+    counts = [0] * MAX_KINDS
+    for number in stack_numbers:
+        counts[number] += 1
+    # 栈中凑满三个的图案会被消除，只有余数影响后续局面；存档里可能留有未消除的三个
+    # （第 8 次点击凑成三个时游戏先判负），ZOBRIST_COUNTS 也只有 0..2 三档
+    counts = [count % 3 for count in counts]
+    return SolverBoard(kinds, cover_masks, max_stack), SolverState(present, counts)
+
+
+class TranspositionTable:
+    """有容量上限的置换表，记录“从该局面出发 depth 步内无法消除”
+
+    同一局面保留搜索深度更大的结果，超出容量时淘汰最久未使用的条目。
+    棋盘变化后需调用 clear()，clear() 会使正在进行的搜索停止读写本表。
+    """
+
+    def __init__(self, capacity=TRANSPOSITION_TABLE_SIZE):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.generation = 0
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def clear(self):
+        self.entries = OrderedDict()
+        self.generation += 1
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def probe(self, key, depth):
+        """若该局面已证明 depth 步内无法消除则返回 True"""
+        self.probes += 1
+        stored_depth = self.entries.get(key)
+        if stored_depth is not None and stored_depth >= depth:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return True
+        return False
+
+    def store(self, key, depth):
+        entries = self.entries
+        stored_depth = entries.get(key)
+        if stored_depth is not None:
+            if stored_depth < depth:
+                entries[key] = depth
+            entries.move_to_end(key)
+            self.stores += 1
+            return
+        entries[key] = depth
+        self.stores += 1
+        while len(entries) > self.capacity:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            'size': len(self.entries),
+            'capacity': self.capacity,
+            'probes': self.probes,
+            'hits': self.hits,
+            'stores': self.stores,
+            'evictions': self.evictions,
+        }
+
+
+class HintSearch:
+    """迭代加深搜索，寻找最快产生一次消除的点击序列"""
+
+    def __init__(self, board, state, time_limit, table=None, should_stop=None):
+        self.board = board
+        self.state = state.copy()
+        self.time_limit = time_limit
+        self.table = TranspositionTable() if table is None else table
+        self.generation = self.table.generation
+        self.should_stop = should_stop  # 返回 True 时放弃搜索，用于取消
+        self.deadline = 0.0
+        self.timed_out = False
+        self.cancelled = False
+        self.nodes = 0
+        self.path = []
+
+    def ordered_moves(self):
+        board = self.board
+        counts = self.state.counts
+        cells = board.free_cells(self.state.present)
+        available = [0] * MAX_KINDS
+        for cell in cells:
+            available[board.kinds[cell]] += 1
+        # 栈中已有的图案优先，其次是可点击数量多的图案
+        cells.sort(key=lambda cell: -(counts[board.kinds[cell]] * 100 + available[board.kinds[cell]]))
+        return cells
+
+    def run(self, max_depth):
+        self.deadline = time.perf_counter() + self.time_limit
+        for depth in range(1, max_depth + 1):
+            if self.dfs(depth):
+                return list(self.path)
+            if self.timed_out:
+                break
+        return []
+
+    def dfs(self, remaining_depth):
+        self.nodes += 1
+        if self.nodes % TIME_CHECK_INTERVAL == 0:
+            if self.should_stop is not None and self.should_stop():
+                self.cancelled = True
+                self.timed_out = True
+            elif time.perf_counter() > self.deadline:
+                self.timed_out = True
+        if self.timed_out or remaining_depth <= 0:
+            return False
+        state = self.state
+        table = self.table
+        use_table = table.generation == self.generation
+        if use_table and table.probe(state.hash, remaining_depth):
+            return False
+        board = self.board
+        for cell in self.ordered_moves():
+            eliminated = state.pick(board, cell)
+            self.path.append(cell)
+            if eliminated:
+                return True
+            if state.stack_size < board.max_stack and self.dfs(remaining_depth - 1):
+                return True
+            self.path.pop()
+            state.unpick(board, cell, eliminated)
+        # 超时时子树没有搜索完整，不能写入置换表
+        if use_table and not self.timed_out:
+            table.store(state.hash, remaining_depth)
+        return False
+
+
+# 整关求解的结果状态
+SOLVE_SOLVED = 'solved'  # 找到了完整的通关路线
+SOLVE_LOST = 'lost'  # 已证明当前局面无法通关
+SOLVE_UNKNOWN = 'unknown'  # 时间或节点预算用完，或为节省内存进行了剪枝，无法下结论
+
+# 整关求解的默认资源限制
+SOLVE_TIME_LIMIT = 3.0  # 秒
+SOLVE_MAX_OPEN = 60000  # 待展开节点数的上限，超过后只保留最好的 SOLVE_BEAM_WIDTH 个
+SOLVE_BEAM_WIDTH = 5000
+SOLVE_MAX_CLOSED = 500000  # 已展开局面集合的上限，超过后清空（只影响效率，不影响正确性）
+
+
+class SolveResult:
+    """整关求解结果，status 为 SOLVE_* 之一，moves 为通关所需的格子序列
+
+    status 为 SOLVE_LOST 时 reason 说明证明方式：'parity' 表示某种图案的总数不是 3 的倍数，
+    'exhausted' 表示在没有任何剪枝的情况下搜索完了全部可达局面。
+    """
+    __slots__ = ('status', 'moves', 'nodes', 'reason')
+
+    def __init__(self, status, moves=None, nodes=0, reason=''):
+        self.status = status
+        self.moves = moves or []
+        self.nodes = nodes
+        self.reason = reason
+
+
+def remaining_kind_counts(board, state):
+    """统计棋盘上和栈中每种图案的剩余数量"""
+    totals = list(state.counts)
+    remaining = state.present
+    while remaining:
+        low_bit = remaining & -remaining
+        totals[board.kinds[low_bit.bit_length() - 1]] += 1
+        remaining ^= low_bit
+    return totals
+
+
+def stack_pressure(counts, stack_size, free_kind_counts):
+    """栈的压力：栈中图案越多、可以直接配对的可点击图案越少，压力越大
+
+    free_kind_counts 为可点击图案中每种图案的数量。
+    """
+    relief = 0
+    for kind, count in enumerate(counts):
+        if count:
+            relief += free_kind_counts[kind]
+    return stack_size * 2 - min(relief, stack_size)
+
+
+def _path_to_list(link):
+    moves = []
+    while link is not None:
+        cell, link = link
+        moves.append(cell)
+    moves.reverse()
+    return moves
+
+
+def solve_level(board, state, time_limit=SOLVE_TIME_LIMIT, max_open=SOLVE_MAX_OPEN,
+                beam_width=SOLVE_BEAM_WIDTH, max_closed=SOLVE_MAX_CLOSED, should_stop=None, max_nodes=None):
+    """搜索清空整个棋盘的点击序列
+
+    每条通关路线的步数都等于剩余图案数，所以 A* 中 g + h 恒定（h 为棋盘上剩余图案数，
+    既可采纳又一致），展开顺序由栈压力决定。待展开节点超过 max_open 时退化为宽度为
+    beam_width 的束搜索，此时搜索不再完备，找不到路线只能返回 SOLVE_UNKNOWN。
+    max_nodes 为展开节点数的上限，搜索是确定的，所以在预算内的结果与机器负载无关。
+    """
+    # 每种图案剩余总数必须是 3 的倍数，否则必然无法通关
+    for kind, total in enumerate(remaining_kind_counts(board, state)):
+        if total % 3:
+            return SolveResult(SOLVE_LOST, reason='parity')
+
+    deadline = time.perf_counter() + time_limit
+    max_stack = board.max_stack
+    work = state.copy()
+    counter = 0
+    open_heap = [(0, counter, work.present, tuple(work.counts), work.stack_size, work.hash, None)]
+    kinds = board.kinds
+    closed = set()
+    nodes = 0
+    complete = True
+    while open_heap:
+        _, _, present, counts, stack_size, hash_value, link = heapq.heappop(open_heap)
+        if present == 0:
+            return SolveResult(SOLVE_SOLVED, _path_to_list(link), nodes)
+        if hash_value in closed:
+            continue
+        if len(closed) >= max_closed:
+            closed.clear()
+        closed.add(hash_value)
+        nodes += 1
+        if max_nodes is not None and nodes > max_nodes:
+            return SolveResult(SOLVE_UNKNOWN, nodes=nodes, reason='budget')
+        if nodes % TIME_CHECK_INTERVAL == 0:
+            if should_stop is not None and should_stop():
+                return SolveResult(SOLVE_UNKNOWN, nodes=nodes, reason='cancelled')
+            if time.perf_counter() > deadline:
+                return SolveResult(SOLVE_UNKNOWN, nodes=nodes, reason='timeout')
+        if stack_size >= max_stack:
+            continue  # 栈已满，无法再点击
+        work.present = present
+        work.counts = list(counts)
+        work.stack_size = stack_size
+        work.hash = hash_value
+        free_cells = board.free_cells(present)
+        free_kind_counts = [0] * MAX_KINDS
+        for cell in free_cells:
+            free_kind_counts[kinds[cell]] += 1
+        remaining = bin(present).count('1') - 1
+        for cell in free_cells:
+            eliminated = work.pick(board, cell)
+            if work.hash not in closed:
+                # 子局面的可点击图案近似为父局面的可点击图案去掉刚点击的一个
+                free_kind_counts[kinds[cell]] -= 1
+                priority = remaining + stack_pressure(work.counts, work.stack_size, free_kind_counts)
+                free_kind_counts[kinds[cell]] += 1
+                counter += 1
+                heapq.heappush(open_heap, (priority, counter, work.present, tuple(work.counts),
+                                           work.stack_size, work.hash, (cell, link)))
+            work.unpick(board, cell, eliminated)
+        if len(open_heap) > max_open:
+            # 内存受限，退化为束搜索
+            open_heap = heapq.nsmallest(beam_width, open_heap)
+            heapq.heapify(open_heap)
+            complete = False
+    if complete:
+        return SolveResult(SOLVE_LOST, nodes=nodes, reason='exhausted')
+    return SolveResult(SOLVE_UNKNOWN, nodes=nodes, reason='pruned')
+
+
+def run_hint_job(board, state, full_solve=False, table=None, should_stop=None):
+    """执行一次提示计算，返回只包含基本类型、可以跨进程传递的结果字典
+
+    full_solve 为 False 时寻找下一次消除，为 True 时求解整关路线。
+    """
+    start_time = time.perf_counter()
+    if full_solve:
+        result = solve_level(board, state, should_stop=should_stop)
+        cells, nodes, status, reason = result.moves, result.nodes, result.status, result.reason
+    else:
+        max_depth = board.max_stack - state.stack_size
+        search = HintSearch(board, state, HINT_TIME_LIMIT, table, should_stop)
+        cells = search.run(max_depth) if max_depth > 0 else []
+        nodes = search.nodes
+        status = SOLVE_SOLVED if cells else SOLVE_UNKNOWN
+        reason = 'cancelled' if search.cancelled else ''
+    return {
+        'cells': cells,
+        'nodes': nodes,
+        'status': status,
+        'reason': reason,
+        'seconds': time.perf_counter() - start_time,
+        'table': table.stats() if table is not None else {},
+    }
+
+
+def split_root_moves(board, state, worker_count):
+    """把根节点的可点击格子按启发式顺序轮流分给各个工作进程"""
+    moves = HintSearch(board, state, 0).ordered_moves()
+    return [moves[i::worker_count] for i in range(worker_count) if moves[i::worker_count]]
+
+
+# 以下在进程池的工作进程中运行
+_worker_job = None  # 主进程共享的当前任务编号（multiprocessing.Value），与任务编号不同即表示已取消
+_worker_best = None  # 并行搜索时各进程共享的已找到的最短序列长度（multiprocessing.Value）
+_worker_table = None
+_worker_table_token = None
+
+
+def init_hint_worker(job_value, best_value=None):
+    global _worker_job, _worker_best
+    _worker_job = job_value
+    _worker_best = best_value
+
+
+def _get_worker_table(board_token):
+    """置换表在同一关的多次任务之间保留"""
+    global _worker_table, _worker_table_token
+    if _worker_table is None or _worker_table_token != board_token:
+        _worker_table = TranspositionTable()
+        _worker_table_token = board_token
+    return _worker_table
+
+
+def _job_cancelled(job_id):
+    return _worker_job is not None and _worker_job.value != job_id
+
+
+def process_hint_job(job_id, board_token, board, state, full_solve):
+    """进程池任务入口"""
+    return run_hint_job(board, state, full_solve, _get_worker_table(board_token),
+                        lambda: _job_cancelled(job_id))
+
+
+def process_root_split_job(job_id, board_token, board, state, root_cells):
+    """并行搜索的任务入口，只搜索以 root_cells 中的格子开头的序列
+
+    各进程按深度同步推进：任一进程找到长度为 L 的序列后，其他进程搜索到深度 L 时立即停止，
+    因为同样长度的序列不会更好。
+    """
+    start_time = time.perf_counter()
+    table = _get_worker_table(board_token)
+    max_depth = board.max_stack - state.stack_size
+    deadline = start_time + HINT_TIME_LIMIT
+    current_depth = [0]
+
+    def should_stop():
+        if _job_cancelled(job_id):
+            return True
+        return _worker_best is not None and _worker_best.value <= current_depth[0]
+
+    best_cells = []
+    nodes = 0
+    cancelled = False
+    work = state.copy()
+    for depth in range(1, max_depth + 1):
+        current_depth[0] = depth
+        if should_stop() or time.perf_counter() > deadline:
+            cancelled = _job_cancelled(job_id)
+            break
+        for cell in root_cells:
+            if should_stop():
+                break
+            eliminated = work.pick(board, cell)
+            if eliminated:
+                path = [cell]
+            elif depth > 1 and work.stack_size < board.max_stack:
+                search = HintSearch(board, work, 0, table, should_stop)
+                search.deadline = deadline
+                path = [cell] + search.path if search.dfs(depth - 1) else []
+                nodes += search.nodes
+            else:
+                path = []
+            work.unpick(board, cell, eliminated)
+            if path:
+                best_cells = path
+                break
+        if best_cells:
+            if _worker_best is not None:
+                with _worker_best.get_lock():
+                    # 已取消的旧任务不能再改写共享值，否则主进程为新任务重置后又被改小，
+                    # 新任务的进程会在很浅的深度就停止
+                    if not _job_cancelled(job_id) and len(best_cells) < _worker_best.value:
+                        _worker_best.value = len(best_cells)
+            break
+    return {
+        'cells': best_cells,
+        'nodes': nodes,
+        'status': SOLVE_SOLVED if best_cells else SOLVE_UNKNOWN,
+        'reason': 'cancelled' if cancelled else '',
+        'seconds': time.perf_counter() - start_time,
+        'table': table.stats(),
+    }
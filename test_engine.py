@@ -0,0 +1,157 @@
+"""规则引擎和求解器的测试：可拿取集合、Zobrist 哈希的增量更新和并行提示搜索
+
+运行：python -m unittest test_engine
+"""
+
+import multiprocessing
+import random
+import threading
+import unittest
+
+import engine
+import solver
+
+GAME_SEED = 12345
+
+
+def new_state(level_num, board_index):
+    seed = engine.level_seed(GAME_SEED + board_index, level_num)
+    kinds, jitter, _ = engine.generate_layout(level_num, seed, False, 0)
+    return engine.GameState(level_num, kinds, jitter)
+
+
+# 不使用遮挡关系图：格子上有图案，且没有任何更高层的图案的角落落在它的范围内
+def brute_force_free(state):
+    positions = {cell: engine.cell_position(cell, state.jitter) for cell, kind in enumerate(state.kinds) if kind}
+    return {
+        cell for cell in positions
+        if not any(upper_cell // engine.LAYER_CELLS > cell // engine.LAYER_CELLS
+                   and engine.covers(positions[upper_cell], positions[cell])
+                   for upper_cell in positions)
+    }
+
+
+class GameStateTest(unittest.TestCase):
+
+    def test_free_matches_brute_force(self):
+        rng = random.Random(1)
+        for board_index in range(6):
+            state = new_state(1 + board_index % 5, board_index)
+            for _ in range(80):
+                with self.subTest(board=board_index, moves=state.moves):
+                    self.assertEqual(state.free, brute_force_free(state))
+                    for kind in range(1, solver.MAX_KINDS):
+                        self.assertEqual(state.free_by_kind[kind],
+                                         {cell for cell in state.free if state.kinds[cell] == kind})
+                if state.status != engine.PLAYING or (state.stack and rng.random() < 0.3):
+                    if not state.undo():
+                        break
+                else:
+                    state.pick(rng.choice(state.free_cells()))
+
+    def test_restored_stack_can_be_undone(self):
+        state = new_state(2, 0)
+        played = new_state(2, 0)
+        for _ in range(2):
+            played.pick(played.free_cells()[0])
+        restored = engine.GameState(2, played.kinds, played.jitter, stack=played.stack)
+        self.assertEqual(restored.free, brute_force_free(restored))
+        while restored.undo():
+            pass
+        self.assertEqual(restored.kinds, state.kinds)
+        self.assertEqual(restored.free, state.free)
+
+    def test_unknown_position_cannot_be_undone(self):
+        state = new_state(1, 0)
+        restored = engine.GameState(1, state.kinds, state.jitter, stack=[(-1, 3)])
+        self.assertFalse(restored.undo())
+        self.assertEqual(restored.stack, [(-1, 3)])
+
+
+class ZobristTest(unittest.TestCase):
+
+    def test_incremental_hash(self):
+        rng = random.Random(2)
+        for board_index in range(4):
+            board, state = new_state(5, board_index).solver_state()
+            history = []
+            for _ in range(300):
+                free_cells = board.free_cells(state.present)
+                if history and (rng.random() < 0.4 or not free_cells or state.stack_size >= board.max_stack):
+                    state.unpick(board, *history.pop())
+                elif free_cells:
+                    cell = rng.choice(free_cells)
+                    history.append((cell, state.pick(board, cell)))
+                else:
+                    break
+                self.assertEqual(state.hash, solver.zobrist_hash(state.present, state.counts))
+                self.assertEqual(state.stack_size, sum(state.counts))
+
+
+class RootSplitTest(unittest.TestCase):
+
+    def tearDown(self):
+        solver.init_hint_worker(None)
+
+    # 随机走几步，栈中的图案各不相同，提示需要更深的搜索，部分局面在栈满前无法消除
+    def positions(self, count):
+        rng = random.Random(3)
+        for board_index in range(count):
+            game_state = new_state(4, board_index)
+            target = rng.randint(3, 6)
+            while game_state.status == engine.PLAYING and len(game_state.stack) < target:
+                cells = [cell for cell in game_state.free_cells()
+                         if not game_state.stack_counts[game_state.kinds[cell]]]
+                game_state.pick(rng.choice(cells or game_state.free_cells()))
+            if game_state.status == engine.PLAYING:
+                yield board_index, game_state.solver_state()
+
+    def assert_eliminates(self, board, state, cells):
+        work = state.copy()
+        for index, cell in enumerate(cells):
+            self.assertTrue(work.present >> cell & 1 and board.is_free(work.present, cell))
+            self.assertEqual(work.pick(board, cell), index == len(cells) - 1)
+
+    def test_split_matches_single_search(self):
+        lengths = set()
+        for job_id, (board, state) in self.positions(24):
+            single = solver.run_hint_job(board, state)
+            split = solver.split_root_moves(board, state, 3)
+            self.assertEqual(sorted(cell for cells in split for cell in cells), board.free_cells(state.present))
+            solver.init_hint_worker(multiprocessing.Value('i', job_id), multiprocessing.Value('i', solver.CELL_COUNT))
+            # 在当前进程中依次执行各部分，共享最短长度的方式与工作进程相同
+            parts = [solver.process_root_split_job(job_id, ('test', job_id), board, state, cells) for cells in split]
+            found = [part['cells'] for part in parts if part['cells']]
+            with self.subTest(job=job_id):
+                self.assertEqual(min(map(len, found)) if found else 0, len(single['cells']))
+                for cells in found:
+                    self.assert_eliminates(board, state, cells)
+            lengths.add(len(single['cells']))
+        self.assertGreater(len(lengths), 1)  # 既有找到的，也有证明找不到的
+
+    def test_cancelled_job_keeps_shared_best(self):
+        job_id, (board, state) = next((job_id, position) for job_id, position in self.positions(24)
+                                      if solver.run_hint_job(*position)['cells'])
+        job = multiprocessing.Value('i', job_id)
+        best = CancelBeforePublish(job)
+        solver.init_hint_worker(job, best)
+        result = solver.process_root_split_job(job_id, ('test', job_id), board, state, board.free_cells(state.present))
+        self.assertTrue(result['cells'])
+        self.assertEqual(best.value, solver.CELL_COUNT)
+
+
+# 共享的最短长度：工作进程取得锁准备写入时，主进程恰好开始了新任务
+class CancelBeforePublish:
+
+    def __init__(self, job):
+        self.job = job
+        self.value = solver.CELL_COUNT
+        self.lock = threading.Lock()
+
+    def get_lock(self):
+        self.job.value += 1
+        return self.lock
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+"""存档格式的往返测试：棋盘数据版本 1、2、3，以及旧格式的 board_layers/stack 存档
+
+运行：python -m unittest test_savestore
+"""
+
+import base64
+import json
+import os
+import stat
+import struct
+import tempfile
+import unittest
+import zlib
+
+import savestore
+
+LAYERS, ROWS, COLS = 3, 8, 8
+CELLS = bytes((i * 7) % 9 if i % 5 else 0 for i in range(LAYERS * ROWS * COLS))
+
+
+# 按旧版本的布局手工打包棋盘数据，用于测试读取旧版本
+def pack_old_board(version, cells, stack=()):
+    parts = [savestore.BOARD_HEADER.pack(savestore.BOARD_MAGIC, version, LAYERS, ROWS, COLS), bytes(cells)]
+    if version >= 2:
+        parts.append(savestore.STACK_COUNT.pack(len(stack)))
+        parts.extend(savestore.STACK_ENTRY.pack(cell, number) for cell, number in stack)
+    return base64.b64encode(zlib.compress(b''.join(parts))).decode('ascii')
+
+
+def to_board_layers(cells):
+    return [
+        [
+            [cells[(layer * ROWS + row) * COLS + col] or None for col in range(COLS)]
+            for row in range(ROWS)
+        ]
+        for layer in range(LAYERS)
+    ]
+
+
+class BoardEncodingTest(unittest.TestCase):
+
+    def test_round_trip_current_version(self):
+        stack = [(5, 3), (savestore.NO_CELL, 8)]
+        jitter = [((i % 9) - 4, (i % 5) - 2) for i in range(len(CELLS))]
+        text = savestore.encode_board(CELLS, LAYERS, ROWS, COLS, stack, jitter)
+        self.assertEqual(savestore.decode_board(text), (LAYERS, ROWS, COLS, CELLS, stack, jitter))
+
+    def test_round_trip_without_jitter(self):
+        text = savestore.encode_board(CELLS, LAYERS, ROWS, COLS)
+        self.assertEqual(savestore.decode_board(text), (LAYERS, ROWS, COLS, CELLS, [], None))
+
+    def test_jitter_extremes(self):
+        jitter = [(-128, 127)] * len(CELLS)
+        text = savestore.encode_board(CELLS, LAYERS, ROWS, COLS, jitter=jitter)
+        self.assertEqual(savestore.decode_board(text)[5], jitter)
+
+    def test_read_version_1(self):
+        self.assertEqual(savestore.decode_board(pack_old_board(1, CELLS)), (LAYERS, ROWS, COLS, CELLS, [], None))
+
+    def test_read_version_2(self):
+        stack = [(0, 1), (191, 2)]
+        self.assertEqual(savestore.decode_board(pack_old_board(2, CELLS, stack)),
+                         (LAYERS, ROWS, COLS, CELLS, stack, None))
+
+    def test_size_mismatch(self):
+        with self.assertRaises(ValueError):
+            savestore.encode_board(CELLS[:-1], LAYERS, ROWS, COLS)
+        with self.assertRaises(ValueError):
+            savestore.encode_board(CELLS, LAYERS, ROWS, COLS, jitter=[(0, 0)])
+
+    def test_rejects_bad_data(self):
+        bad_magic = base64.b64encode(zlib.compress(struct.pack('<3sBBBB', b'XXX', 1, 1, 1, 1) + b'\0')).decode()
+        future_version = base64.b64encode(zlib.compress(savestore.BOARD_HEADER.pack(
+            savestore.BOARD_MAGIC, savestore.BOARD_VERSION + 1, LAYERS, ROWS, COLS) + CELLS)).decode()
+        truncated = base64.b64encode(zlib.compress(savestore.BOARD_HEADER.pack(
+            savestore.BOARD_MAGIC, 3, LAYERS, ROWS, COLS) + CELLS)).decode()
+        for text in ('not base64!', bad_magic, future_version, pack_old_board(1, CELLS[:10]), truncated):
+            with self.subTest(text=text[:16]):
+                with self.assertRaises(ValueError):
+                    savestore.decode_board(text)
+
+
+class MigrationTest(unittest.TestCase):
+
+    def test_legacy_board_layers_and_stack(self):
+        legacy = {'player_name': 'a', 'score': 300, 'level': 2, 'selected_character': 1,
+                  'stack': [4, 4], 'board_layers': to_board_layers(CELLS)}
+        game = savestore.migrate_game(legacy)
+        self.assertNotIn('board_layers', game)
+        self.assertNotIn('stack', game)
+        self.assertEqual(game['score'], 300)
+        self.assertEqual(savestore.decode_board(game['board']),
+                         (LAYERS, ROWS, COLS, CELLS, [(savestore.NO_CELL, 4)] * 2, None))
+        self.assertIn('board_layers', legacy)  # 不修改原条目
+
+    def test_packed_board_with_legacy_stack(self):
+        game = savestore.migrate_game({'score': 0, 'stack': [6], 'board': pack_old_board(2, CELLS, [(9, 3)])})
+        self.assertEqual(savestore.decode_board(game['board'])[4], [(9, 3), (savestore.NO_CELL, 6)])
+
+    def test_current_entry_unchanged(self):
+        game = {'score': 0, 'board': savestore.encode_board(CELLS, LAYERS, ROWS, COLS)}
+        self.assertIs(savestore.migrate_game(game), game)
+
+
+class SaveStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'savegame.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_legacy_file_is_migrated_and_rewritten(self):
+        legacy = {'saved_games': [
+            {'player_name': 'a', 'score': 100, 'level': 1, 'stack': [2], 'board_layers': to_board_layers(CELLS)},
+            {'player_name': 'b', 'score': 200, 'level': 3, 'stack': [], 'board_layers': to_board_layers(CELLS)},
+        ]}
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(legacy, f, indent=4)
+        store = savestore.SaveStore(self.path)
+        self.assertEqual([game['player_name'] for game in store.saved_games()], ['b', 'a'])
+        store.record({'player_name': 'c', 'score': 150, 'level': 2,
+                      'board': savestore.encode_board(CELLS, LAYERS, ROWS, COLS, [(1, 5)], [(1, -1)] * len(CELLS))})
+        store.close()
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self.assertEqual(data['format'], savestore.SAVE_FORMAT_VERSION)
+        self.assertTrue(all('board_layers' not in game for game in data['saved_games']))
+
+        reloaded = savestore.SaveStore(self.path).saved_games()
+        self.assertEqual([game['player_name'] for game in reloaded], ['b', 'c', 'a'])
+        self.assertEqual(savestore.decode_board(reloaded[1]['board'])[3:],
+                         (CELLS, [(1, 5)], [(1, -1)] * len(CELLS)))
+        self.assertEqual(savestore.decode_board(reloaded[2]['board'])[4], [(savestore.NO_CELL, 2)])
+
+    def test_keeps_highest_scores(self):
+        store = savestore.SaveStore(self.path, max_entries=2)
+        board = savestore.encode_board(CELLS, LAYERS, ROWS, COLS)
+        for score in (10, 30, 20, 5):
+            store.record({'score': score, 'board': board})
+        store.close()
+        self.assertEqual([game['score'] for game in savestore.SaveStore(self.path).saved_games()], [30, 20])
+
+    @unittest.skipIf(os.name == 'nt', "Windows 只有只读属性")
+    def test_keeps_file_mode(self):
+        board = savestore.encode_board(CELLS, LAYERS, ROWS, COLS)
+        store = savestore.SaveStore(self.path)
+        store.record({'score': 1, 'board': board})
+        store.flush()
+        umask = os.umask(0)
+        os.umask(umask)
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o666 & ~umask)
+        os.chmod(self.path, 0o640)
+        store.record({'score': 2, 'board': board})
+        store.close()
+        self.assertEqual(stat.S_IMODE(os.stat(self.path).st_mode), 0o640)
+
+
+if __name__ == '__main__':
+    unittest.main()